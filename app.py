@@ -4,9 +4,12 @@
 # ====================== Import libraries ====================== #
 
 import os
+import time
 import streamlit as st
 import pandas as pd
 import utils
+import metrics as mx
+# image_service (PIL) and voice_input (speech_recognition) are imported on first use
 
 
 # ====================== Definitions and functions ====================== #
@@ -25,22 +28,104 @@ FilterProdDesc            = "Product description"
 FilterProdLst             = "Product list"
 UserBasedFilter           = "User-based Filtering"
 ItemBasedFilter           = "Item-based Filtering"
+HybridFilter              = "Hybrid Filtering"
 DEF_SIMILARITY_THRESHOLD  = 0.4
 DEF_RATING_THRESHOLD      = 3.0
+DEF_HYBRID_CONTENT_WEIGHT = utils.HYBRID_CONTENT_WEIGHT
+VOICE_POLL_INTERVAL       = 0.5
+SEARCH_PAGE_SIZE          = utils.si.SEARCH_PAGE_SIZE
 
 
 # ====================== Declarations ====================== #
 
 pr_ = utils.ProductRecommendations()
 
+@st.cache_resource()
+def get_image_service():
+  """Image service (thread pool + thumbnail cache) shared by all sessions"""
+  return utils.lazy_import('image_service').ImageService(No_Image_Available)
+
+
+def session_cached(name, key, compute):
+  """Get the value last computed for the same inputs in this session, otherwise compute it
+  Parameters
+  ----------
+  name : str
+      Name of the cached value, one entry is kept per name
+  key : tuple
+      Inputs of the computation
+  compute : callable
+      Called without arguments on a miss
+
+  Returns
+  -------
+    object
+      Cached or computed value
+  """
+  cache = st.session_state.setdefault('session_cache', {})
+  # Entries computed on another version of the artifacts are stale
+  key = (utils.get_data_store().version, key)
+  entry = cache.get(name)
+  if entry is not None and entry[0] == key:
+    mx.count('session.hit.' + name)
+    return entry[1]
+  mx.count('session.miss.' + name)
+  value = compute()
+  cache[name] = (key, value)
+  return value
+
+
+def last_query(name, query, submitted):
+  """Remember the inputs of the last submitted search, so its results stay on screen across reruns
+  Parameters
+  ----------
+  name : str
+      Name of the page
+  query : tuple
+      Inputs of the search, the first one (user, product or description) is the subject
+  submitted : bool
+      Whether the search button was clicked in this run
+
+  Returns
+  -------
+    tuple or None
+      Inputs of the last search, None if there is none for the current subject
+  """
+  key = 'last_query_' + name
+  if submitted:
+    st.session_state[key] = query
+  last = st.session_state.get(key)
+  if last is None or last[0] != query[0]:
+    return None
+  return last
+
+
+def rating_history_html(df_rating):
+  """Render a rating history with clickable links
+  Parameters
+  ----------
+  df_rating : pandas.DataFrame
+      Rating history with a link column
+
+  Returns
+  -------
+    str
+      HTML table
+  """
+  df_rating = df_rating.copy()
+  df_rating['link'] = df_rating['link'].apply(utils.make_clickable)
+  return df_rating.to_html(escape=False)
+
 
 # ====================== Streamlit GUI & Process ====================== #
-def product_info_display(row):
+def product_info_display(row, image_=None):
   """Display product info in a grid
   Parameters
   ----------
   row : pandas.core.series.Series
       A row of the dataframe
+  image_ : str
+      Thumbnail path of the product image, fetched from row.image if None
 
   Returns
   -------
@@ -48,11 +133,9 @@ def product_info_display(row):
   """ 
   # --- display product image ---
   if row.image != None:
-    # Check if image can be displayed
-    try:
-      st.image(row.image, width=100, caption=f'ID {int(row.product_id)}', use_column_width='auto')
-    except:
-      st.image(No_Image_Available, width=100, caption=f'ID {int(row.product_id)}', use_column_width='auto')
+    if image_ is None:
+      image_ = get_image_service().get(row.image)
+    st.image(image_, width=100, caption=f'ID {int(row.product_id)}', use_column_width='auto')
   else:
     st.write('No image')
   # --- display product_id and product_name ---
@@ -65,7 +148,31 @@ def product_info_display(row):
   return
 
 
-def handle_cb_search_button_click(desc, rec_nums, threshold, isVoice):
+def product_grid_display(results):
+  """Display products in a grid of three columns
+  Parameters
+  ----------
+  results : pandas.core.frame.DataFrame
+      Products with product_id, product_name, image and link
+
+  Returns
+  -------
+    None
+  """
+  # Fetch the thumbnails of the whole page concurrently before rendering
+  with mx.stage('render.fetch_images'):
+    images = get_image_service().get_many(results['image'].tolist())
+  # create a grid with three columns and display the product images with the same size
+  with mx.stage('render.grid'):
+    col1, col2, col3 = st.columns(3)
+    for group_num, group in results.groupby((results.index % 3)):
+      with col1 if group_num == 0 else col2 if group_num == 1 else col3:
+        for row in group.itertuples():
+          product_info_display(row, images[row.Index])
+  return
+
+
+def handle_cb_search_button_click(desc, rec_nums, threshold, isVoice, filter_=None, exclude_query=True):
   """Handle search button click
   Parameters
   ----------
@@ -75,42 +182,87 @@ def handle_cb_search_button_click(desc, rec_nums, threshold, isVoice):
       Number of recommended products
   isVoice : bool
       Whether the input is from voice or not
+  filter_ : utils.ProductFilter
+      Constraints on the recommended products
+  exclude_query : bool
+      Whether to exclude the searched product (product ID search)
 
   Returns
   -------
     None
   """
   if isVoice:
-    description = utils.takecomand()
+    # Capture and recognition run in the background, voice_search_poll picks up the text
+    vi = utils.lazy_import('voice_input')
+    st.session_state['voice_job'] = (utils.get_voice_pipeline().submit(vi.MicrophoneCapture()),
+                                     time.monotonic(), rec_nums, threshold, filter_, exclude_query)
+    st.write("Tell me your product's ID or description ...")
+    return
   else:
     description = desc
 
   # Get info of the product
   if description.isdigit():
-    product_info_  = pr_.get_product_info_(int(description))
+    product_info_  = session_cached('product_info', (description,), lambda: pr_.get_product_info_(int(description)))
     if product_info_ is not None:
       product_info_display(product_info_.iloc[0])
 
-  # Get top similar products
-  results = pr_.recommend_products(description, rec_nums, threshold)
+  # Get top similar products (with their info), recomputed only when an input changed
+  def search():
+    results = pr_.recommend_products(description, rec_nums, threshold, filter_, exclude_query)
+    if results.empty:
+      return results
+    return pr_.get_product_info(results, 'product_id', ['product_name', 'product_name_description_processed', 'image', 'link'])
+  try:
+    results = session_cached('content_results', (description, rec_nums, threshold, filter_, exclude_query), search)
+  except utils.qx.ExecutorBusy:
+    # Nothing is cached, so searching again with the same inputs retries
+    st.warning('Too many searches at the moment, please try again')
+    return
   # Check if the results is empty
   if results.empty:
-    st.error('No similar products found!')
+    if filter_ is not None and filter_.matches_nothing():
+      st.warning('No product matches the filters, check the category keyword and the minimum ALS rating')
+    else:
+      st.error('No similar products found!')
     return
   # Add separator
   st.markdown('---')
   # Display top similar products found
   st.write('Top {} similar products with similarity >= {}:'.format(results.shape[0], round(threshold, 2)))
-  # Get info of the product
-  results = pr_.get_product_info(results, 'product_id')
   st.write(results[['product_id', 'similarity', 'product_name', 'product_name_description_processed', 'image']])
 
-  # create a grid with four columns and display the product images in 2 columns with the same size
-  col1, col2, col3 = st.columns(3)
-  for group_num, group in results.groupby((results.index % 3)):
-    with col1 if group_num == 0 else col2 if group_num == 1 else col3:
-      for row in group.itertuples():
-        product_info_display(row)
+  product_grid_display(results)
+  return
+
+
+def voice_search_poll():
+  """Poll the background voice job, then search with the recognized text
+  Parameters
+  ----------
+
+  Returns
+  -------
+    None
+  """
+  job = st.session_state.get('voice_job')
+  if job is None:
+    return
+  future, started, rec_nums, threshold, filter_, exclude_query = job
+  vi = utils.lazy_import('voice_input')
+  if not future.done() and time.monotonic() - started < vi.RECOGNIZE_TIMEOUT:
+    # Rerun shortly instead of blocking the script on the recognizer
+    st.info('Listening ...')
+    time.sleep(VOICE_POLL_INTERVAL)
+    st.rerun()
+  del st.session_state['voice_job']
+  try:
+    description = utils.get_voice_pipeline().result(future, timeout=0)
+  except vi.VoiceInputError as e:
+    st.error(str(e))
+    return
+  st.write("Your input :", description)
+  handle_cb_search_button_click(description, rec_nums, threshold, False, filter_, exclude_query)
   return
 
 
@@ -129,15 +281,19 @@ def handle_cf_user_search_button_click(user_id, rec_nums, threshold):
   -------
     None
   """
-  # --- Get top rating history of that user ---
-  df_rating = pr_.get_top_user_rated_items(user_id)
+  # --- Get top rating history of that user (rendered once per user) ---
+  history_html = session_cached('user_history', (user_id,),
+                                lambda: rating_history_html(pr_.get_top_user_rated_items(user_id)))
   with st.expander('See rating history of user'):
-    df_rating['link'] = df_rating['link'].apply(utils.make_clickable)
-    df_rating = df_rating.to_html(escape=False)
-    st.write(df_rating, unsafe_allow_html=True)
-
-  # --- Get top recommended products ---
-  results = pr_.get_rec_user_items(user_id, rec_nums, threshold)
+    st.write(history_html, unsafe_allow_html=True)
+
+  # --- Get top recommended products (with their info) ---
+  def search():
+    results = pr_.get_rec_user_items(user_id, rec_nums, threshold)
+    if results.empty:
+      return results
+    return pr_.get_product_info(results, 'product_id')
+  results = session_cached('user_results', (user_id, rec_nums, threshold), search)
   # Check if the results is empty
   if results.empty:
     st.error('No recommended products found!')
@@ -146,15 +302,8 @@ def handle_cf_user_search_button_click(user_id, rec_nums, threshold):
   st.markdown('---')
   # Display top recommended products found
   st.write('Top {} recommended products with rating >= {}:'.format(results.shape[0], round(threshold, 2)))
-  # Get info of the product
-  results = pr_.get_product_info(results, 'product_id')
   st.write(results[['product_id', 'product_name', 'rating', 'image', 'link']])
-  # create a grid with four columns and display the product images in 2 columns with the same size
-  col1, col2, col3 = st.columns(3)
-  for group_num, group in results.groupby((results.index % 3)):
-    with col1 if group_num == 0 else col2 if group_num == 1 else col3:
-      for row in group.itertuples():
-        product_info_display(row)
+  product_grid_display(results)
   return
 
 
@@ -174,14 +323,17 @@ def handle_cf_item_search_button_click(product_id, rec_nums, threshold):
     None
   """
   # Get top potential users
-  results, df_rating = pr_.get_rec_item_users(product_id, rec_nums, threshold)
+  recs_ = session_cached('item_results', (product_id, rec_nums, threshold),
+                         lambda: pr_.get_rec_item_users(product_id, rec_nums, threshold))
   # Check if the results is empty
-  if results is None:
+  if recs_ is None:
     st.error('No potential users found!')
     return
+  results, df_rating = recs_
   # Get item info
-  item_info_  = pr_.get_product_info_(product_id)
-  product_info_display(item_info_.iloc[0])
+  item_info_  = session_cached('product_info', (str(product_id),), lambda: pr_.get_product_info_(product_id))
+  if item_info_ is not None:
+    product_info_display(item_info_.iloc[0])
 
   # Add separator
   st.markdown('---')
@@ -190,13 +342,80 @@ def handle_cf_item_search_button_click(product_id, rec_nums, threshold):
   st.write(results[['user_id', 'user', 'rating']])
   st.markdown('---')
   # Display rating history of users
+  history_html = session_cached('item_history', (product_id, rec_nums, threshold), lambda: rating_history_html(df_rating))
   with st.expander('See rating history of users'):
-    df_rating['link'] = df_rating['link'].apply(utils.make_clickable)
-    df_rating = df_rating.to_html(escape=False)
-    st.write(df_rating, unsafe_allow_html=True)
+    st.write(history_html, unsafe_allow_html=True)
   return
 
 
+def handle_hybrid_search_button_click(user_id, desc, rec_nums, content_weight):
+  """Handle hybrid (content + collaborative) search button click
+  Parameters
+  ----------
+  user_id : int
+      User ID
+  desc : str
+      Optional query text
+  rec_nums : int
+      Number of recommended products
+  content_weight : float
+      Weight of the content similarity, the ALS rating gets the rest
+
+  Returns
+  -------
+    None
+  """
+  def search():
+    with st.spinner('Searching ...'):
+      results = pr_.get_hybrid_recs(user_id, desc, rec_nums, content_weight, 1.0 - content_weight)
+    if results.empty:
+      return results
+    return pr_.get_product_info(results, 'product_id')
+  results = session_cached('hybrid_results', (user_id, desc, rec_nums, content_weight), search)
+  # Check if the results is empty
+  if results.empty:
+    st.error('No recommended products found!')
+    return
+  # Add separator
+  st.markdown('---')
+  # Display top recommended products found
+  st.write('Top {} recommended products (content weight = {}):'.format(results.shape[0], round(content_weight, 2)))
+  st.write(results[['product_id', 'product_name', 'score', 'content_score', 'cf_score', 'link']])
+  product_grid_display(results)
+  return
+
+
+def search_selectbox(label, index_, key):
+  """Selectbox backed by a server-side search index, only one page of matches is sent
+  Parameters
+  ----------
+  label : str
+      Label of the selectbox
+  index_ : search_index.SearchIndex
+      Index of "id - name" labels
+  key : str
+      Widget key prefix
+
+  Returns
+  -------
+    str or None
+      Selected "id - name" label, None if nothing matches
+  """
+  col1, col2 = st.columns([3, 1])
+  query = col1.text_input('Search by ID or name',
+                          key=key + '_query',
+                          help='Type the ID or part of the name, then press Enter.')
+  positions = index_.match(query)
+  page_count = max(1, -(-len(positions) // SEARCH_PAGE_SIZE))
+  page_num = col2.number_input('Page', min_value=1, max_value=page_count, value=1, step=1,
+                               key=key + '_page', help='{} matches'.format(len(positions)))
+  labels = index_.page(positions, int(page_num) - 1, SEARCH_PAGE_SIZE)
+  if not labels:
+    st.warning('No match found!')
+    return None
+  return st.selectbox(label, labels, key=key + '_select')
+
+
 def content_gui(desc, isVoice=False):
   """Content-based filtering GUI
   Parameters
@@ -236,10 +455,29 @@ def content_gui(desc, isVoice=False):
                               value=DEF_SIMILARITY_THRESHOLD,
                               step=0.05,
                               help='Similarity threshold (0.0 ~ 1.0) to filter products')
+  # Constraints applied in the top-k stage
+  with st.expander('Filters'):
+    keyword = st.text_input('Category keyword',
+                            help='Only keep products whose name or description contains every word, e.g. "áo thun".')
+    min_als_rating = st.number_input('Minimum ALS rating',
+                                     min_value=0.0,
+                                     max_value=10.0,
+                                     value=0.0,
+                                     step=0.5,
+                                     help='Only keep products whose best predicted ALS rating is at least this value (0 = no filter).')
+    exclude_query = st.checkbox('Exclude the searched product', value=True,
+                                help='When searching by product ID, do not recommend the product itself.')
+  filter_ = utils.ProductFilter(keyword, min_als_rating if min_als_rating > 0 else None)
   # Add button to search
   search_button = st.form_submit_button(label='Search')
-  if search_button:
-    handle_cb_search_button_click(description, rec_nums, threshold, isVoice)
+  if isVoice:
+    if search_button:
+      handle_cb_search_button_click(description, rec_nums, threshold, isVoice, filter_, exclude_query)
+    return
+  # Keep the results of the last search on screen across reruns
+  query = last_query('content', (description, rec_nums, threshold, isVoice, filter_, exclude_query), search_button)
+  if query is not None:
+    handle_cb_search_button_click(*query)
   return
 
 
@@ -271,8 +509,9 @@ def user_gui(user_id):
                               help='Rating threshold (0.0 ~ 5.0) to filter products')
   # Add button to search
   search_button = st.form_submit_button(label='Search')
-  if search_button:
-    handle_cf_user_search_button_click(user_id, rec_nums, threshold)
+  query = last_query('user', (user_id, rec_nums, threshold), search_button)
+  if query is not None:
+    handle_cf_user_search_button_click(*query)
   return
 
 
@@ -304,8 +543,43 @@ def item_gui(item_id):
                               help='Rating threshold (0.0 ~ 5.0) to filter products')
   # Add button to search
   search_button = st.form_submit_button(label='Search')
-  if search_button:
-    handle_cf_item_search_button_click(item_id, rec_nums, threshold)
+  query = last_query('item', (item_id, rec_nums, threshold), search_button)
+  if query is not None:
+    handle_cf_item_search_button_click(*query)
+  return
+
+
+def hybrid_gui(user_id):
+  """Hybrid filtering GUI
+  Parameters
+  ----------
+  user_id : int
+      User ID
+
+  Returns
+  -------
+    None
+  """
+  # Optional query text, the rating history of the user is used when empty
+  description = st.text_input('Product Description (optional)',
+                              help='Leave empty to use the rating history of the user.')
+  col1, col2 = st.columns(2)
+  rec_nums = col1.slider('Number of Recommendations',
+                          min_value=1,
+                          max_value=10,
+                          value=5,
+                          step=1)
+  content_weight = col2.slider('Content Weight',
+                              min_value=0.0,
+                              max_value=1.0,
+                              value=DEF_HYBRID_CONTENT_WEIGHT,
+                              step=0.05,
+                              help='Weight of the content similarity (0.0 ~ 1.0), the ALS rating gets the rest')
+  # Add button to search
+  search_button = st.form_submit_button(label='Search')
+  query = last_query('hybrid', (user_id, description, rec_nums, content_weight), search_button)
+  if query is not None:
+    handle_hybrid_search_button_click(*query)
   return
 
 
@@ -324,10 +598,14 @@ def content_based_filtering(filter_option, isVoice=False):
     # Stick widgets
     with st.form(key='my_form'):
       content_gui(None, isVoice)
+    if isVoice:
+      voice_search_poll()
   elif filter_option == FilterProdLst:
+    product_info = search_selectbox("Select a product", pr_.get_product_search_index(), key='product')
+    if product_info is None:
+      return
     # Stick widgets
     with st.form(key='my_form'):
-      product_info = st.selectbox("Select a product", pr_.get_product_id_name_list())
       # Extract product_id from product_info
       product_id = product_info.split(' - ')[0]
       content_gui(product_id)
@@ -347,32 +625,74 @@ def collaborative_based_filtering(filter_option):
   """
   if filter_option == UserBasedFilter:
     # --- Get top user with rating ---
-    df_rating = pr_.get_top_user_with_rating()
+    df_rating = session_cached('top_users', (), pr_.get_top_user_with_rating)
     with st.expander('See top user with ratings'):
       st.write(df_rating)
 
+    # Select user's ID
+    user_id_name = search_selectbox("Select User ID", pr_.get_user_search_index(), key='user')
+    if user_id_name is None:
+      return
     # Stick widgets
     with st.form(key='my_form'):
-      # Select user's ID
-      user_id_name = st.selectbox("Select User ID", pr_.get_all_user_ids_names())
       user_id = int(user_id_name.split(' - ')[0])
       user_gui(user_id)
   elif filter_option == ItemBasedFilter:
+    item_id_name = search_selectbox("Select Item ID", pr_.get_item_search_index(), key='item')
+    if item_id_name is None:
+      return
     # Stick widgets
     with st.form(key='my_form'):
-      item_id_name  = st.selectbox("Select Item ID",
-                              pr_.get_all_item_ids_names(),
-                              # format_func=lambda x: x.split(' - ')[0],
-                              )
       item_id = int(item_id_name.split(' - ')[0])
       item_gui(item_id)
+  elif filter_option == HybridFilter:
+    # Select user's ID
+    user_id_name = search_selectbox("Select User ID", pr_.get_user_search_index(), key='user')
+    if user_id_name is None:
+      return
+    # Stick widgets
+    with st.form(key='my_form'):
+      user_id = int(user_id_name.split(' - ')[0])
+      hybrid_gui(user_id)
+  return
+
+
+def debug_panel():
+  """Sidebar panel with the per-stage latency metrics (RECSYS_METRICS=1) and the startup profile (RECSYS_PROFILE_STARTUP=1)
+  Parameters
+  ----------
+
+  Returns
+  -------
+    None
+  """
+  if mx.startup.enabled:
+    startup = mx.startup.snapshot()
+    st.sidebar.markdown('---')
+    with st.sidebar.expander('Debug: startup profile (ms)'):
+      if startup['stages']:
+        st.dataframe(pd.DataFrame.from_dict(startup['stages'], orient='index')[['count', 'total_ms']].round(3))
+  if not mx.metrics.enabled:
+    return
+  snapshot = mx.metrics.snapshot()
+  st.sidebar.markdown('---')
+  with st.sidebar.expander('Debug: per-stage latency (ms)'):
+    if snapshot['stages']:
+      st.dataframe(pd.DataFrame.from_dict(snapshot['stages'], orient='index').round(3))
+    st.write(snapshot['counts'])
+    # Read-only: the metrics are shared by every session of the process
+    st.download_button('Download metrics (JSON)', mx.metrics.to_json(), file_name='metrics.json', mime='application/json')
   return
 
 
 def main():
+  # The whole run uses one version of the artifacts, a new version is picked up by the next run
+  store = utils.pin_data_store()
   # --- Sidebar --- 
   # Add title to the sidebar
   st.sidebar.title('Shopee Recommendation System')
+  if store.version:
+    st.sidebar.caption(f'Artifacts: {store.version}')
   # Use radio button to choose between content-based filltering and collaborative filtering
   page = st.sidebar.radio('Menu', menu_)
   if page == BussinessObjective:
@@ -432,13 +752,14 @@ def main():
     st.image(CollaUserItemImg, width=700)
     st.write("# Collaborative Filtering")
     # Add select box to choose between product list and manual input
-    option = st.sidebar.selectbox("Select option for fitler", [UserBasedFilter, ItemBasedFilter])
+    option = st.sidebar.selectbox("Select option for fitler", [UserBasedFilter, ItemBasedFilter, HybridFilter])
     # Add brief description on the sidebar
     st.sidebar.markdown('---')
     st.sidebar.title('About')
     st.sidebar.info("This is a search engine for fashion products")
     st.sidebar.info("- User-based filtering: The search engine will return the most recommended products based on the user's ID.")
     st.sidebar.info("- Item-based filtering: The search engine will return potential customers for that product.")
+    st.sidebar.info("- Hybrid filtering: The search engine will blend the user's ALS recommendations with content similarity to an optional description.")
     # Add separator
     st.sidebar.markdown('---')
     # A brief description about the search engine
@@ -465,6 +786,9 @@ def main():
                         Pay attention to this parameter to not make the model overfitting.')
     collaborative_based_filtering(option)
 
+  # --- Debug metrics (rendered last to include this run) ---
+  debug_panel()
+
 
 # ====================== Main ====================== #
 if __name__ == "__main__":
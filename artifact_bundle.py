@@ -0,0 +1,306 @@
+"""Versioned, checksummed bundle of the model and data artifacts
+-------
+@note   A bundle directory holds one sub-directory per version and a CURRENT file naming the live version:
+          <bundle>/CURRENT
+          <bundle>/versions/<version>/manifest.json   (format, version, groups, size and sha256 of every file)
+          <bundle>/versions/<version>/<group>.*       (written by shared_store.save_group: .npy, Arrow, gensim, .npz)
+        A version is written to a temporary directory, checksummed, then renamed; CURRENT is replaced atomically,
+        so a reader never sees a partial version. Older versions are pruned (BUNDLE_KEEP are kept).
+        Workers started with RECSYS_BUNDLE=<bundle> verify and memory-map the CURRENT version. A BundleWatcher
+        thread polls CURRENT; a new version is verified and warmed up in the background, then swapped in
+        (see utils.swap_data_store), so sessions never wait for it to load.
+        Each build activates a new version, which every running worker then swaps in, so it must not run at
+        each worker start. A worker started on a bundle without CURRENT (e.g. a fresh dyno or container, whose
+        files are not shared with a release step) builds the first version itself with ensure(), under a file
+        lock, so the workers starting together build it once.
+@usage  python artifact_bundle.py build --bundle Artifacts
+        python artifact_bundle.py ensure --bundle Artifacts (build only if there is no CURRENT version)
+        python artifact_bundle.py verify --bundle Artifacts
+        python artifact_bundle.py activate --bundle Artifacts --version 20260101-120000-4242 (roll back)
+"""
+
+"""Import libraries"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+import shared_store as ss
+import metrics as mx
+
+"""Define global variables"""
+BUNDLE_DIR          = 'Artifacts'
+BUNDLE_FORMAT       = 1
+CURRENT_FILE        = 'CURRENT'
+VERSIONS_DIR        = 'versions'
+MANIFEST_FILE       = 'manifest.json'
+LOCK_FILE           = '.lock'
+# Groups of utils.DataStore written to a version
+BUNDLE_GROUPS       = ['gensim_dictionary', 'gensim_tfidf'] + ss.SHARED_GROUPS + ['customer_graph']
+BUNDLE_KEEP         = 3
+BUNDLE_POLL_S       = float(os.environ.get('RECSYS_BUNDLE_POLL', '10'))
+HASH_CHUNK_SIZE     = 1 << 20
+
+class BundleError(Exception):
+  """Raised when a version is missing, incomplete or does not match its manifest"""
+  pass
+
+def _sha256(file_path):
+  digest = hashlib.sha256()
+  with open(file_path, 'rb') as file:
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+def _write_atomic(file_path, text):
+  tmp_path = file_path + '.tmp'
+  with open(tmp_path, 'w', encoding='utf8') as file:
+    file.write(text)
+  os.replace(tmp_path, file_path)
+
+def version_path(bundle_dir, version):
+  """Directory of a version
+  Parameters
+  ----------
+  Arguments:
+    bundle_dir  {str} -- [Bundle directory]
+    version     {str} -- [Version name]
+  Returns:
+    path {str}
+  """
+  return os.path.join(bundle_dir, VERSIONS_DIR, version)
+
+def current_version(bundle_dir):
+  """Read the live version
+  Parameters
+  ----------
+  Arguments:
+    bundle_dir {str}  -- [Bundle directory]
+  Returns:
+    version {str}     -- [Version name, None if no version was activated]
+  """
+  try:
+    with open(os.path.join(bundle_dir, CURRENT_FILE), 'r', encoding='utf8') as file:
+      return file.read().strip() or None
+  except FileNotFoundError:
+    return None
+
+def verify(bundle_dir, version):
+  """Check every file of a version against its manifest
+  Parameters
+  ----------
+  Arguments:
+    bundle_dir  {str}   -- [Bundle directory]
+    version     {str}   -- [Version name]
+  Returns:
+    manifest {dict}     -- [Manifest of the version]
+  """
+  path = version_path(bundle_dir, version)
+  try:
+    with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf8') as file:
+      manifest = json.load(file)
+  except (OSError, ValueError) as e:
+    raise BundleError(f'{version}: cannot read the manifest ({e})') from e
+  if manifest.get('format') != BUNDLE_FORMAT:
+    raise BundleError(f'{version}: unsupported format {manifest.get("format")}')
+  for name, entry in manifest['files'].items():
+    file_path = os.path.join(path, name)
+    if not os.path.exists(file_path) or os.path.getsize(file_path) != entry['size']:
+      raise BundleError(f'{version}: {name} is missing or truncated')
+    if _sha256(file_path) != entry['sha256']:
+      raise BundleError(f'{version}: {name} does not match its checksum')
+  return manifest
+
+def open_version(bundle_dir, version):
+  """Verify a version before it is used
+  Parameters
+  ----------
+  Arguments:
+    bundle_dir  {str} -- [Bundle directory]
+    version     {str} -- [Version name]
+  Returns:
+    path {str}        -- [Directory of the version, to be attached with shared_store.load_group]
+  """
+  verify(bundle_dir, version)
+  return version_path(bundle_dir, version)
+
+def activate(bundle_dir, version):
+  """Make a verified version the live one (the running workers swap to it)
+  Parameters
+  ----------
+  Arguments:
+    bundle_dir  {str} -- [Bundle directory]
+    version     {str} -- [Version name]
+  """
+  verify(bundle_dir, version)
+  _write_atomic(os.path.join(bundle_dir, CURRENT_FILE), version + '\n')
+
+def prune(bundle_dir, keep=BUNDLE_KEEP):
+  """Remove the oldest versions, the live one is always kept
+  Parameters
+  ----------
+  Arguments:
+    bundle_dir  {str} -- [Bundle directory]
+  Keyword Arguments:
+    keep        {int} -- [Number of versions to keep]
+  Returns:
+    removed {list}    -- [Removed version names]
+  """
+  versions_dir = os.path.join(bundle_dir, VERSIONS_DIR)
+  current = current_version(bundle_dir)
+  versions = [v for v in os.listdir(versions_dir) if os.path.exists(os.path.join(versions_dir, v, MANIFEST_FILE))]
+  versions.sort(key=lambda v: os.path.getmtime(os.path.join(versions_dir, v, MANIFEST_FILE)), reverse=True)
+  removed = [v for v in versions[keep:] if v != current]
+  for version in removed:
+    # Workers still mapping the files keep them alive until they swap
+    shutil.rmtree(os.path.join(versions_dir, version))
+  return removed
+
+def build(store, bundle_dir=BUNDLE_DIR, version=None, groups=BUNDLE_GROUPS, keep=BUNDLE_KEEP):
+  """Write a new version from a data store, then activate it
+  Parameters
+  ----------
+  Arguments:
+    store {utils.DataStore} -- [Data store loading from the original files]
+  Keyword Arguments:
+    bundle_dir  {str}       -- [Bundle directory]
+    version     {str}       -- [Version name (default: creation time and process id)]
+    groups      {list}      -- [Groups to write]
+    keep        {int}       -- [Number of versions to keep]
+  Returns:
+    version {str}
+  """
+  # Unique even if several builds run at the same time
+  version = version or f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}'
+  path = version_path(bundle_dir, version)
+  if os.path.exists(path):
+    raise BundleError(f'{version} already exists')
+  tmp_dir = f'{path}.tmp-{os.getpid()}'
+  os.makedirs(tmp_dir)
+  try:
+    for group in groups:
+      ss.save_group(tmp_dir, group, store.load(group))
+    open(os.path.join(tmp_dir, ss.READY_FILE), 'w').close()
+    files = {}
+    for root, _, names in os.walk(tmp_dir):
+      for name in names:
+        file_path = os.path.join(root, name)
+        files[os.path.relpath(file_path, tmp_dir)] = {'size': os.path.getsize(file_path), 'sha256': _sha256(file_path)}
+    manifest = {'format': BUNDLE_FORMAT, 'version': version, 'created': time.time(), 'groups': list(groups),
+                'files': dict(sorted(files.items()))}
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w', encoding='utf8') as file:
+      json.dump(manifest, file, indent=2)
+    try:
+      os.rename(tmp_dir, path)
+    except OSError as e:
+      # Another build wrote the same version name meanwhile
+      raise BundleError(f'{version} already exists') from e
+  except BaseException:
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    raise
+  activate(bundle_dir, version)
+  prune(bundle_dir, keep)
+  return version
+
+def ensure(bundle_dir, make_store, keep=BUNDLE_KEEP):
+  """Build a first version when the bundle has none, once for all the workers starting at the same time
+  Parameters
+  ----------
+  Arguments:
+    bundle_dir  {str}       -- [Bundle directory]
+    make_store  {callable}  -- [make_store() -> utils.DataStore loading from the original files, only called to build]
+  Keyword Arguments:
+    keep        {int}       -- [Number of versions to keep]
+  Returns:
+    version {str}           -- [CURRENT version]
+  """
+  import fcntl
+  os.makedirs(bundle_dir, exist_ok=True)
+  with open(os.path.join(bundle_dir, LOCK_FILE), 'w') as lock:
+    # The first worker builds, the others wait for the lock and find CURRENT
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    version = current_version(bundle_dir)
+    if version is None:
+      version = build(make_store(), bundle_dir, keep=keep)
+    return version
+
+class BundleWatcher:
+  def __init__(self, bundle_dir, version, on_change, poll_s=BUNDLE_POLL_S):
+    """Background thread following the CURRENT version of a bundle
+    Parameters
+    ----------
+    Arguments:
+      bundle_dir  {str}       -- [Bundle directory]
+      version     {str}       -- [Version in use]
+      on_change   {callable}  -- [on_change(version) opens and swaps in a new version, raises if it cannot]
+    Keyword Arguments:
+      poll_s      {float}     -- [Seconds between two reads of CURRENT]
+    """
+    self.bundle_dir = bundle_dir
+    self.version    = version
+    self.on_change  = on_change
+    self.poll_s     = poll_s
+    self.last_error = None
+    self._failed    = None
+    self._stop      = threading.Event()
+    self._thread    = threading.Thread(target=self._run, name='bundle-watcher', daemon=True)
+
+  def start(self):
+    """Start polling"""
+    self._thread.start()
+
+  def stop(self):
+    """Stop polling"""
+    self._stop.set()
+
+  def check(self):
+    """Swap to the CURRENT version if it changed
+    Returns:
+      swapped {bool}
+    """
+    version = current_version(self.bundle_dir)
+    # A version that failed is not retried until CURRENT changes again
+    if version is None or version in (self.version, self._failed):
+      return False
+    try:
+      self.on_change(version)
+    except Exception as e:
+      self._failed, self.last_error = version, str(e)
+      mx.count('bundle.swap_failed')
+      return False
+    self.version, self._failed, self.last_error = version, None, None
+    return True
+
+  def _run(self):
+    while not self._stop.wait(self.poll_s):
+      self.check()
+
+def main():
+  parser = argparse.ArgumentParser(description='Build, verify or activate a version of the artifact bundle')
+  parser.add_argument('command', choices=['build', 'ensure', 'verify', 'activate'])
+  parser.add_argument('--bundle', default=BUNDLE_DIR, help='Bundle directory')
+  parser.add_argument('--version', default=None, help='Version name (default: new version for build, CURRENT otherwise)')
+  parser.add_argument('--keep', type=int, default=BUNDLE_KEEP, help='Number of versions to keep')
+  args = parser.parse_args()
+  if args.command in ('build', 'ensure'):
+    import utils
+    if args.command == 'build':
+      version = build(utils.DataStore(shared_dir=''), args.bundle, args.version, keep=args.keep)
+    else:
+      version = ensure(args.bundle, lambda: utils.DataStore(shared_dir=''), keep=args.keep)
+    print(f'{args.bundle}: {version} is current')
+    return
+  version = args.version or current_version(args.bundle)
+  if version is None:
+    raise SystemExit(f'{args.bundle}: no current version')
+  if args.command == 'verify':
+    manifest = verify(args.bundle, version)
+    print(f'{version}: {len(manifest["files"])} files ok')
+  else:
+    activate(args.bundle, version)
+    print(f'{args.bundle}: {version} is current')
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,333 @@
+"""Benchmark of the recommendation paths on synthetic data
+-------
+@note   Generates synthetic catalogs and rating tables in the same schemas as the files loaded by utils.py,
+        then measures latency, throughput and peak memory of each recommendation path.
+        Every scale runs in its own process (utils.py loads its data from the working directory).
+@usage  python benchmark.py --scales small,medium --out bench_results.json
+        python benchmark.py --scales small --compare bench_baseline.json
+        python benchmark.py --scales small --threads 8 (query executor throughput with 1 to 8 threads)
+"""
+
+"""Import libraries"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tracemalloc
+import subprocess
+import numpy as np
+import catalog_store
+
+"""Define global variables"""
+REPO_PATH       = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR       = os.path.join(REPO_PATH, '.bench')
+# name: (products, ratings)
+SCALES          = {
+  'small'   : (10_000, 100_000),
+  'medium'  : (100_000, 1_000_000),
+  'large'   : (1_000_000, 10_000_000),
+}
+VOCAB_NUM       = 5_000
+DESC_WORDS_NUM  = 15
+ALS_RECS_NUM    = 5
+QUERIES_NUM     = 20
+THREAD_QUERIES  = 200
+SEED            = 42
+# Real words of the catalog, the most frequent words of the synthetic vocabulary
+SYLLABLES       = ['áo', 'quần', 'thun', 'nam', 'sơ', 'mi', 'jean', 'kaki', 'dài', 'ngắn', 'tay', 'cổ', 'trơn', 'túi',
+                   'ví', 'da', 'bò', 'giày', 'dép', 'mũ', 'vải', 'cotton', 'co', 'giãn', 'thể', 'thao', 'đen', 'trắng',
+                   'xanh', 'đỏ', 'size', 'form', 'rộng', 'ôm', 'lót', 'khoác', 'gió', 'nỉ', 'len', 'lụa']
+# Parts of the plain syllables (onset + toned vowel + final) filling the rest of the vocabulary
+ONSETS          = ['', 'b', 'c', 'ch', 'd', 'đ', 'g', 'gi', 'h', 'k', 'kh', 'l', 'm', 'n', 'ng', 'nh', 'ph', 'qu', 'r',
+                   's', 't', 'th', 'tr', 'v', 'x']
+VOWELS          = ['aáàảãạ', 'âấầẩẫậ', 'eéèẻẽẹ', 'êếềểễệ', 'iíìỉĩị', 'oóòỏõọ', 'ôốồổỗộ', 'ơớờởỡợ', 'uúùủũụ', 'ưứừửữự']
+FINALS          = ['', 'c', 'ch', 'm', 'n', 'ng', 'nh', 'p', 't']
+
+
+# ====================== Synthetic data ====================== #
+def make_vocab(rng, vocab_num=VOCAB_NUM):
+  """Build a vocabulary of plain syllables, the real words first
+  @note   Compound words ("áo_thun") are dropped by text_preprocessing, so a description made of them would
+          turn into an empty query.
+  """
+  syllables = {onset + vowel + final for onset in ONSETS for vowels in VOWELS for vowel in vowels for final in FINALS}
+  syllables = sorted(syllables - set(SYLLABLES))
+  return np.array(SYLLABLES + rng.choice(syllables, vocab_num - len(SYLLABLES), replace=False).tolist())
+
+def generate_data(work_dir, products_num, ratings_num, seed=SEED):
+  """Write synthetic data files and gensim artifacts into work_dir
+  Parameters
+  ----------
+  Arguments:
+    work_dir      {str} -- [Output directory, laid out like the repository root]
+    products_num  {int} -- [Number of products]
+    ratings_num   {int} -- [Number of ratings]
+  Keyword Arguments:
+    seed          {int} -- [Random seed]
+  Returns:
+    None
+  """
+  import pandas as pd
+  from gensim import corpora, models, similarities
+
+  rng = np.random.default_rng(seed)
+  data_dir = os.path.join(work_dir, 'Data')
+  os.makedirs(data_dir, exist_ok=True)
+  shutil.copy(os.path.join(REPO_PATH, 'Data', 'vietnamese-stopwords.txt'), data_dir)
+
+  # --- Catalog: Products_ThoiTrangNam_raw_final.csv ---
+  vocab = make_vocab(rng)
+  # Zipf-like word frequencies, as in real descriptions (the real words are the most frequent)
+  freq = 1.0 / np.arange(1, len(vocab) + 1)
+  words = rng.choice(len(vocab), size=(products_num, DESC_WORDS_NUM), p=freq / freq.sum())
+  descriptions = [' '.join(vocab[row]) for row in words]
+  product_ids = np.arange(1, products_num + 1) * 3
+  catalog = pd.DataFrame({'product_id'                          : product_ids,
+                          'product_name'                        : [d.replace('_', ' ')[:60] for d in descriptions],
+                          'category'                            : 'Thời Trang Nam',
+                          'price'                               : rng.integers(10, 1000, products_num) * 1000,
+                          'rating'                              : rng.uniform(0, 5, products_num).round(1),
+                          'image'                               : [f'https://cf.shopee.vn/file/{i}' for i in product_ids],
+                          'link'                                : [f'https://shopee.vn/product-i.{i}' for i in product_ids],
+                          'product_name_description_processed'  : descriptions})
+  catalog.to_csv(os.path.join(data_dir, 'Products_ThoiTrangNam_raw_final.csv'), index=False, encoding='utf8')
+  catalog_store.build(os.path.join(data_dir, 'Products_ThoiTrangNam_raw_final.csv'), os.path.join(data_dir, 'catalog.arrow'))
+
+  # --- Ratings: Products_ThoiTrangNam_rating_processed.csv (tab separated) ---
+  users_num = max(ratings_num // 20, 1)
+  user_ids = np.arange(1, users_num + 1)
+  # Few users rate a lot, most users rate a little
+  user_p = 1.0 / np.arange(1, users_num + 1) ** 0.8
+  rating_users = rng.choice(user_ids, size=ratings_num, p=user_p / user_p.sum())
+  ratings = pd.DataFrame({'product_id'  : rng.choice(product_ids, size=ratings_num),
+                          'user_id'     : rating_users,
+                          'user'        : np.char.add('user_', rating_users.astype(str)),
+                          'rating'      : rng.choice([1, 2, 3, 4, 5], size=ratings_num, p=[0.05, 0.05, 0.1, 0.2, 0.6])})
+  ratings.to_csv(os.path.join(data_dir, 'Products_ThoiTrangNam_rating_processed.csv'), sep='\t', index=False, encoding='utf8')
+
+  # --- ALS exports: UsrRecMatrix_.csv and ItemRecMatrix_.csv ---
+  rated_users = np.unique(rating_users)
+  user_recs = pd.DataFrame({'user_id'     : np.repeat(rated_users, ALS_RECS_NUM),
+                            'product_id'  : rng.choice(product_ids, size=len(rated_users) * ALS_RECS_NUM),
+                            'rating'      : rng.uniform(2.0, 6.5, size=len(rated_users) * ALS_RECS_NUM)})
+  user_recs.to_csv(os.path.join(data_dir, 'UsrRecMatrix_.csv'), index=False)
+  item_recs = pd.DataFrame({'product_id'  : np.repeat(product_ids, ALS_RECS_NUM),
+                            'user_id'     : rng.choice(rated_users, size=products_num * ALS_RECS_NUM),
+                            'rating'      : rng.uniform(2.0, 6.5, size=products_num * ALS_RECS_NUM)})
+  item_recs.to_csv(os.path.join(data_dir, 'ItemRecMatrix_.csv'), index=False)
+
+  # --- Gensim dictionary, TF-IDF model and similarity index ---
+  texts = [d.split() for d in descriptions]
+  dictionary = corpora.Dictionary(texts)
+  corpus = [dictionary.doc2bow(t) for t in texts]
+  tfidf = models.TfidfModel(corpus)
+  index = similarities.SparseMatrixSimilarity(tfidf[corpus], num_features=len(dictionary))
+  dictionary.save(os.path.join(work_dir, 'gensim_dictionary.dict'))
+  tfidf.save(os.path.join(work_dir, 'gensim_tfidf.tfidf'))
+  index.save(os.path.join(work_dir, 'gensim_model.model'))
+  return
+
+
+# ====================== Measurements ====================== #
+def measure(func, args_list, repeat=1):
+  """Measure latency, throughput and peak memory of func over a list of arguments
+  Parameters
+  ----------
+  Arguments:
+    func      {callable}  -- [Function to measure]
+    args_list {list}      -- [List of argument tuples, one call each]
+  Keyword Arguments:
+    repeat    {int}       -- [Number of passes over args_list]
+  Returns:
+    result {dict}         -- [calls, mean/p50/p95/max latency (ms), throughput (ops/s), peak memory (MB)]
+  """
+  latencies = []
+  start = time.perf_counter()
+  for _ in range(repeat):
+    for args in args_list:
+      t = time.perf_counter()
+      func(*args)
+      latencies.append(time.perf_counter() - t)
+  elapsed = time.perf_counter() - start
+  # Peak memory of a single call (tracemalloc slows the call down, so it is measured separately)
+  tracemalloc.start()
+  func(*args_list[0])
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  latencies = np.array(latencies) * 1e3
+  return {'calls'           : len(latencies),
+          'mean_ms'         : float(latencies.mean()),
+          'p50_ms'          : float(np.percentile(latencies, 50)),
+          'p95_ms'          : float(np.percentile(latencies, 95)),
+          'max_ms'          : float(latencies.max()),
+          'throughput_ops'  : float(len(latencies) / elapsed),
+          'peak_mem_mb'     : peak / 2**20}
+
+def max_rss_mb():
+  """Peak resident memory of this process in MB"""
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+def run_scale(work_dir, repeat=1, seed=SEED):
+  """Benchmark the recommendation paths on the data of work_dir (run inside a child process)
+  Parameters
+  ----------
+  Arguments:
+    work_dir  {str} -- [Directory written by generate_data]
+  Keyword Arguments:
+    repeat    {int} -- [Number of passes over the queries]
+    seed      {int} -- [Random seed of the queries]
+  Returns:
+    result {dict}   -- [Load time, memory and per-operation measurements]
+  """
+  os.environ.setdefault('STREAMLIT_LOGGER_LEVEL', 'error')
+  os.chdir(work_dir)
+  sys.path.insert(0, REPO_PATH)
+  start = time.perf_counter()
+  import utils
+  pr_ = utils.ProductRecommendations()
+  # Touch the lazily loaded artifacts so their load is part of the load time
+  product_ids = utils.df['product_id'].to_numpy()
+  user_ids = utils.df_user['user_id'].unique()
+  item_ids = utils.df_item['product_id'].unique()
+  load_s = time.perf_counter() - start
+  rss_loaded = max_rss_mb()
+
+  rng = np.random.default_rng(seed)
+  names = utils.df['product_name'].to_numpy()
+  texts = [(str(t),) for t in rng.choice(names, QUERIES_NUM)]
+  preprocess = getattr(utils.text_preprocessing, '__wrapped__', utils.text_preprocessing)
+  ops = {
+    'text_preprocessing'          : (preprocess, texts),
+    'recommend_products_id'       : (pr_.recommend_products, [(str(p), 10, 0.0) for p in rng.choice(product_ids, QUERIES_NUM)]),
+    'recommend_products_text'     : (pr_.recommend_products, [(t[0], 10, 0.0) for t in texts]),
+    'get_rec_user_items'          : (pr_.get_rec_user_items, [(int(u), 5, 0.0) for u in rng.choice(user_ids, QUERIES_NUM)]),
+    'get_rec_item_users'          : (pr_.get_rec_item_users, [(int(p), 5, 0.0) for p in rng.choice(item_ids, QUERIES_NUM)]),
+    'get_top_user_rated_items'    : (pr_.get_top_user_rated_items, [(int(u),) for u in rng.choice(user_ids, QUERIES_NUM)]),
+    'get_top_user_with_rating'    : (pr_.get_top_user_with_rating, [()] * 3),
+  }
+  results = {}
+  for name, (func, args_list) in ops.items():
+    # Warm up (first call may build caches)
+    func(*args_list[0])
+    results[name] = measure(func, args_list, repeat)
+  return {'load_s': load_s, 'rss_loaded_mb': rss_loaded, 'rss_peak_mb': max_rss_mb(), 'ops': results}
+
+def run_threads(work_dir, threads_max, seed=SEED):
+  """Measure the throughput of the query executor with 1 to threads_max threads (run inside a child process)
+  Parameters
+  ----------
+  Arguments:
+    work_dir    {str} -- [Directory written by generate_data]
+    threads_max {int} -- [Largest number of threads]
+  Keyword Arguments:
+    seed        {int} -- [Random seed of the queries]
+  Returns:
+    result {dict}     -- [Number of threads -> throughput (queries/s) and speedup over 1 thread]
+  """
+  os.environ.setdefault('STREAMLIT_LOGGER_LEVEL', 'error')
+  os.chdir(work_dir)
+  sys.path.insert(0, REPO_PATH)
+  import utils
+  import query_executor as qx
+  rng = np.random.default_rng(seed)
+  descriptions = utils.df['product_name_description_processed'].to_numpy()
+  # Query vectors are prepared up front: only the numeric core (similarity scan + top-k) is measured
+  vectors = [utils.get_query_vector(str(d)) for d in rng.choice(descriptions, THREAD_QUERIES)]
+  utils.get_similar_top_k(vectors[0], 10)
+  results = {}
+  for threads in range(1, threads_max + 1):
+    executor = qx.QueryExecutor(workers=threads, queue_size=2 * threads, wait_s=60.0)
+    start = time.perf_counter()
+    # Submitting blocks while the queue is full (backpressure)
+    futures = [executor.submit(utils.get_similar_top_k, v, 10, 0.0) for v in vectors]
+    for future in futures:
+      future.result()
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+    results[threads] = {'throughput_ops': THREAD_QUERIES / elapsed}
+    results[threads]['speedup'] = results[threads]['throughput_ops'] / results[1]['throughput_ops']
+  return results
+
+
+# ====================== Main ====================== #
+def compare(results, baseline):
+  """Print the latency ratio of each operation against a baseline result file"""
+  for scale, res in results['scales'].items():
+    base = baseline.get('scales', {}).get(scale)
+    if base is None:
+      continue
+    print(f'--- {scale} (current / baseline) ---')
+    for op, m in res['ops'].items():
+      if op in base['ops']:
+        ratio = m['p50_ms'] / max(base['ops'][op]['p50_ms'], 1e-9)
+        flag = '  <-- regression' if ratio > 1.2 else ''
+        print(f'{op:28s} p50 {m["p50_ms"]:10.3f} ms  x{ratio:5.2f}{flag}')
+
+def print_threads(results):
+  """Print the throughput of the query executor for each number of threads"""
+  for scale, res in results['scales'].items():
+    if 'threads' not in res:
+      continue
+    print(f'--- {scale} query executor ({results["meta"]["cpu_count"]} CPUs) ---')
+    for threads, m in res['threads'].items():
+      print(f'{threads:>3} threads {m["throughput_ops"]:10.1f} queries/s  x{m["speedup"]:5.2f}')
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark the recommendation paths on synthetic data')
+  parser.add_argument('--scales', default='small', help='Comma separated scales: ' + ', '.join(SCALES))
+  parser.add_argument('--out', default='bench_results.json', help='Output JSON file')
+  parser.add_argument('--repeat', type=int, default=1, help='Number of passes over the queries')
+  parser.add_argument('--work-dir', default=BENCH_DIR, help='Directory of the synthetic data')
+  parser.add_argument('--regenerate', action='store_true', help='Regenerate the synthetic data')
+  parser.add_argument('--compare', default=None, help='Baseline JSON file to compare with')
+  parser.add_argument('--threads', type=int, default=0, help='Measure the query executor with 1 to N threads')
+  parser.add_argument('--run', default=None, help=argparse.SUPPRESS)
+  parser.add_argument('--run-threads', type=int, default=0, help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  # Child process: benchmark one scale and print the result
+  if args.run and args.run_threads:
+    print(json.dumps(run_threads(args.run, args.run_threads)))
+    return
+  if args.run:
+    print(json.dumps(run_scale(args.run, args.repeat)))
+    return
+
+  results = {'meta': {'timestamp': time.time(), 'python': platform.python_version(), 'platform': platform.platform(),
+                      'cpu_count': os.cpu_count(), 'repeat': args.repeat},
+             'scales': {}}
+  for scale in args.scales.split(','):
+    products_num, ratings_num = SCALES[scale]
+    work_dir = os.path.join(args.work_dir, scale)
+    if args.regenerate or not os.path.exists(os.path.join(work_dir, 'gensim_model.model')):
+      print(f'Generating {scale}: {products_num} products, {ratings_num} ratings ...', file=sys.stderr)
+      start = time.perf_counter()
+      generate_data(work_dir, products_num, ratings_num)
+      print(f'  done in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+    print(f'Benchmarking {scale} ...', file=sys.stderr)
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', work_dir, '--repeat', str(args.repeat)],
+                          capture_output=True, text=True, check=True)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result.update({'products': products_num, 'ratings': ratings_num})
+    if args.threads:
+      print(f'Query executor {scale}: 1 to {args.threads} threads ...', file=sys.stderr)
+      proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', work_dir, '--run-threads', str(args.threads)],
+                            capture_output=True, text=True, check=True)
+      result['threads'] = json.loads(proc.stdout.strip().splitlines()[-1])
+    results['scales'][scale] = result
+
+  with open(args.out, 'w', encoding='utf8') as file:
+    json.dump(results, file, indent=2)
+  print(f'Results written to {args.out}', file=sys.stderr)
+  print_threads(results)
+  if args.compare:
+    with open(args.compare, 'r', encoding='utf8') as file:
+      compare(results, json.load(file))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,145 @@
+"""Compact store of the product catalog
+-------
+@note   The catalog columns used by the app are written once to an uncompressed Arrow IPC file
+        (int32 product_id, Arrow string columns). Loading memory-maps the file: the string buffers are
+        shared with the page cache instead of being copied into Python objects by every worker.
+        Falls back to reading the CSV (with the same compact dtypes) when the store is missing or stale.
+@usage  python catalog_store.py --csv Data/Products_ThoiTrangNam_raw_final.csv --out Data/catalog.arrow
+"""
+
+"""Import libraries"""
+import os
+import argparse
+import pandas as pd
+import pyarrow as pa
+import ingest
+
+"""Define global variables"""
+CATALOG_CSV_PATH    = './Data/Products_ThoiTrangNam_raw_final.csv'
+CATALOG_STORE_PATH  = './Data/catalog.arrow'
+CATALOG_ID_COLUMN   = 'product_id'
+CATALOG_COLUMNS     = ['product_id', 'product_name', 'image', 'link', 'product_name_description_processed']
+
+def _schema(columns):
+  return pa.schema([(c, pa.int32() if c == CATALOG_ID_COLUMN else pa.string()) for c in columns])
+
+def _types_mapper(type_):
+  # Strings stay Arrow-backed (zero-copy), numbers become numpy columns
+  if pa.types.is_string(type_) or pa.types.is_large_string(type_):
+    return pd.ArrowDtype(type_)
+  return None
+
+def read_table(csv_path, columns=CATALOG_COLUMNS):
+  """Read the needed columns of the catalog CSV as an Arrow table
+  Parameters
+  ----------
+  Arguments:
+    csv_path {str}    -- [Catalog CSV path]
+  Keyword Arguments:
+    columns {list}    -- [Columns to keep]
+  Returns:
+    table {pa.Table}  -- [Catalog table]
+  """
+  # Chunked, validated read of the used columns only. Strict: a dropped row would shift every row after it
+  # against the rows of the similarity index
+  df = ingest.read_frame(csv_path, {column: ingest.CATALOG_SCHEMA[column] for column in columns}, strict=True)
+  return pa.Table.from_pandas(df, preserve_index=False).cast(_schema(columns))
+
+def write_table(table, store_path):
+  """Write an Arrow table to an uncompressed IPC file (can be memory-mapped)
+  Parameters
+  ----------
+  Arguments:
+    table       {pa.Table}  -- [Table]
+    store_path  {str}       -- [Output path]
+  """
+  # Write then rename, so a reader never maps a partial file
+  tmp_path = store_path + '.tmp'
+  with pa.OSFile(tmp_path, 'wb') as sink:
+    with pa.ipc.new_file(sink, table.schema) as writer:
+      writer.write_table(table)
+  os.replace(tmp_path, store_path)
+
+def map_table(store_path):
+  """Memory-map an IPC file written by write_table
+  Parameters
+  ----------
+  Arguments:
+    store_path {str}  -- [Store path]
+  Returns:
+    table {pa.Table}  -- [Table backed by the mapped file]
+  """
+  return pa.ipc.open_file(pa.memory_map(store_path, 'r')).read_all()
+
+def to_frame(table):
+  """Convert an Arrow table to a data frame without copying the mapped buffers
+  Parameters
+  ----------
+  Arguments:
+    table {pa.Table}    -- [Table]
+  Returns:
+    df {pd.DataFrame}   -- [Data frame, numeric columns are read-only views]
+  """
+  # One block per column: numeric columns without nulls are zero-copy views
+  return table.to_pandas(types_mapper=_types_mapper, split_blocks=True)
+
+def build(csv_path=CATALOG_CSV_PATH, store_path=CATALOG_STORE_PATH, columns=CATALOG_COLUMNS):
+  """Write the catalog store
+  Parameters
+  ----------
+  Keyword Arguments:
+    csv_path    {str}   -- [Catalog CSV path]
+    store_path  {str}   -- [Output path of the store]
+    columns     {list}  -- [Columns to keep]
+  Returns:
+    rows {int}          -- [Number of products]
+  """
+  table = read_table(csv_path, columns)
+  write_table(table, store_path)
+  return table.num_rows
+
+def is_fresh(csv_path=CATALOG_CSV_PATH, store_path=CATALOG_STORE_PATH):
+  """Check whether the store exists and is not older than the CSV
+  Parameters
+  ----------
+  Keyword Arguments:
+    csv_path    {str}   -- [Catalog CSV path]
+    store_path  {str}   -- [Store path]
+  Returns:
+    fresh {bool}
+  """
+  if not os.path.exists(store_path):
+    return False
+  return not os.path.exists(csv_path) or os.path.getmtime(store_path) >= os.path.getmtime(csv_path)
+
+def load(csv_path=CATALOG_CSV_PATH, store_path=CATALOG_STORE_PATH, columns=CATALOG_COLUMNS):
+  """Load the catalog as a compact data frame, memory-mapped from the store when it is fresh
+  Parameters
+  ----------
+  Keyword Arguments:
+    csv_path    {str}     -- [Catalog CSV path]
+    store_path  {str}     -- [Store path]
+    columns     {list}    -- [Columns to keep]
+  Returns:
+    df {pd.DataFrame}     -- [Catalog with int32 product_id and Arrow string columns]
+  """
+  if is_fresh(csv_path, store_path):
+    table = map_table(store_path).select(columns)
+  else:
+    table = read_table(csv_path, columns)
+  return to_frame(table)
+
+def main():
+  parser = argparse.ArgumentParser(description='Build the compact catalog store')
+  parser.add_argument('--csv', default=CATALOG_CSV_PATH, help='Catalog CSV path')
+  parser.add_argument('--out', default=CATALOG_STORE_PATH, help='Output path of the store')
+  parser.add_argument('--force', action='store_true', help='Rebuild even if the store is fresh')
+  args = parser.parse_args()
+  if not args.force and is_fresh(args.csv, args.out):
+    print(f'{args.out} is up to date')
+    return
+  rows = build(args.csv, args.out)
+  print(f'{args.out}: {rows} products')
+
+if __name__ == '__main__':
+  main()
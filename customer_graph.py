@@ -0,0 +1,290 @@
+"""Related-customers graph for item-based targeting
+-------
+@note   For each product of the ALS export, its top predicted users (sorted by rating) and, for each of those users,
+        their top rated items, stored as flat arrays with offsets (CSR layout) instead of being assembled per request.
+        Rows are found through a dense id -> row table when ids are compact (constant time), by binary search otherwise.
+        Only GRAPH_USERS_NUM users are kept per product: utils serves larger requests from the ALS export.
+        When the ALS export changes, refresh() re-ranks the products and only computes the histories of new users.
+@usage  python customer_graph.py --out Data/customer_graph.npz
+"""
+
+"""Import libraries"""
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+"""Define global variables"""
+GRAPH_USERS_NUM     = 20
+GRAPH_ITEMS_NUM     = 5
+# Dense id -> row tables are used when max id <= DENSE_ID_FACTOR * number of ids + DENSE_ID_MIN
+DENSE_ID_FACTOR     = 8
+DENSE_ID_MIN        = 1_000_000
+_ARRAYS             = ['product_ids', 'user_offsets', 'users', 'user_ratings', 'digests',
+                       'hist_user_ids', 'item_offsets', 'items', 'item_ratings']
+
+def _ranges(starts, lengths):
+  # Concatenation of arange(start, start + length) for each segment
+  lengths = np.asarray(lengths, dtype=np.int64)
+  if lengths.sum() == 0:
+    return np.empty(0, dtype=np.int64)
+  ends = np.cumsum(lengths)
+  return np.repeat(np.asarray(starts, dtype=np.int64) - (ends - lengths), lengths) + np.arange(ends[-1])
+
+def _top_per_key(keys, values, others, top_num):
+  """Keep the top_num highest values of each key
+  Parameters
+  ----------
+  Arguments:
+    keys    {np.ndarray}  -- [Group keys]
+    values  {np.ndarray}  -- [Values to rank, descending]
+    others  {np.ndarray}  -- [Payload aligned on keys]
+    top_num {int}         -- [Rows kept per key]
+  Returns:
+    unique_keys {np.ndarray}  -- [Sorted keys]
+    offsets     {np.ndarray}  -- [Start of each key in the kept rows, plus the end]
+    others      {np.ndarray}  -- [Kept payload]
+    values      {np.ndarray}  -- [Kept values]
+    order       {np.ndarray}  -- [Sort order of the input rows]
+    starts      {np.ndarray}  -- [Start of each key in the sorted input rows]
+  """
+  # By key, then value descending (stable: ties keep the input order)
+  order = np.lexsort((-values, keys))
+  keys, values, others = keys[order], values[order], others[order]
+  starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.empty(0, dtype=np.int64)
+  counts = np.diff(np.r_[starts, len(keys)])
+  rank = np.arange(len(keys)) - np.repeat(starts, counts)
+  keep = rank < top_num
+  offsets = np.r_[0, np.cumsum(np.minimum(counts, top_num))].astype(np.int64)
+  return keys[starts], offsets, others[keep], values[keep], order, starts
+
+class _RowLookup:
+  def __init__(self, ids):
+    """Map sorted unique ids to their row
+    Parameters
+    ----------
+    Arguments:
+      ids {np.ndarray}  -- [Sorted unique ids]
+    """
+    self.ids    = ids
+    self.table  = None
+    if len(ids) and ids[0] >= 0 and ids[-1] <= DENSE_ID_FACTOR * len(ids) + DENSE_ID_MIN:
+      self.table = np.full(int(ids[-1]) + 1, -1, dtype=np.int32)
+      self.table[ids] = np.arange(len(ids), dtype=np.int32)
+
+  def rows(self, ids):
+    """Get the rows of ids, -1 if missing"""
+    ids = np.asarray(ids, dtype=np.int64)
+    if self.table is not None:
+      found = (ids >= 0) & (ids < len(self.table))
+      return np.where(found, self.table[np.where(found, ids, 0)], -1)
+    if len(self.ids) == 0:
+      return np.full(len(ids), -1)
+    idx = np.clip(np.searchsorted(self.ids, ids), 0, len(self.ids) - 1)
+    return np.where(self.ids[idx] == ids, idx, -1)
+
+"""Define CustomerGraph class"""
+class CustomerGraph:
+  def __init__(self, product_ids, user_offsets, users, user_ratings, digests,
+               hist_user_ids, item_offsets, items, item_ratings):
+    """Initialize the CustomerGraph class from its arrays (see build)
+    Parameters
+    ----------
+    Arguments:
+      product_ids   {np.ndarray}  -- [Sorted product IDs of the ALS export]
+      user_offsets  {np.ndarray}  -- [Start of the users of each product, plus the end]
+      users         {np.ndarray}  -- [Top predicted users of each product, by rating descending]
+      user_ratings  {np.ndarray}  -- [Predicted ratings of those users]
+      digests       {np.ndarray}  -- [Hash of the ALS rows of each product, to detect changes]
+      hist_user_ids {np.ndarray}  -- [Sorted user IDs having a history]
+      item_offsets  {np.ndarray}  -- [Start of the items of each user, plus the end]
+      items         {np.ndarray}  -- [Top rated items of each user, by rating descending]
+      item_ratings  {np.ndarray}  -- [Ratings of those items]
+    """
+    self.product_ids    = product_ids
+    self.user_offsets   = user_offsets
+    self.users          = users
+    self.user_ratings   = user_ratings
+    self.digests        = digests
+    self.hist_user_ids  = hist_user_ids
+    self.item_offsets   = item_offsets
+    self.items          = items
+    self.item_ratings   = item_ratings
+    self._product_rows  = _RowLookup(product_ids)
+    self._user_rows     = _RowLookup(hist_user_ids)
+
+  @classmethod
+  def build(cls, df_item, df_rating, users_num=GRAPH_USERS_NUM, items_num=GRAPH_ITEMS_NUM):
+    """Build the graph
+    Parameters
+    ----------
+    Arguments:
+      df_item   {pd.DataFrame}  -- [ALS export: product_id, user_id, rating]
+      df_rating {pd.DataFrame}  -- [Ratings: product_id, user_id, rating]
+    Keyword Arguments:
+      users_num {int}           -- [Users kept per product]
+      items_num {int}           -- [Items kept per user]
+    Returns:
+      graph {CustomerGraph}
+    """
+    products = cls._products(df_item, users_num)
+    return cls(*products, *cls._histories(df_rating, np.unique(products[2]), items_num))
+
+  @staticmethod
+  def _products(df_item, users_num):
+    product_ids, user_offsets, users, user_ratings, order, starts = _top_per_key(
+      df_item['product_id'].to_numpy(), df_item['rating'].to_numpy(), df_item['user_id'].to_numpy(), users_num)
+    # Order-insensitive digest of the ALS rows of each product
+    hashes = pd.util.hash_pandas_object(df_item[['product_id', 'user_id', 'rating']], index=False).to_numpy()[order]
+    digests = np.add.reduceat(hashes, starts) if len(starts) else np.empty(0, dtype=np.uint64)
+    return product_ids, user_offsets, users, user_ratings, digests
+
+  @staticmethod
+  def _histories(df_rating, user_ids, items_num):
+    mask = np.isin(df_rating['user_id'].to_numpy(), user_ids)
+    hist_user_ids, item_offsets, items, item_ratings, _, _ = _top_per_key(
+      df_rating['user_id'].to_numpy()[mask], df_rating['rating'].to_numpy()[mask],
+      df_rating['product_id'].to_numpy()[mask], items_num)
+    return hist_user_ids, item_offsets, items, item_ratings
+
+  def refresh(self, df_item, df_rating, users_num=GRAPH_USERS_NUM, items_num=GRAPH_ITEMS_NUM):
+    """Get the graph of a new ALS export, reusing the histories of the users already known
+    Parameters
+    ----------
+    Arguments:
+      df_item   {pd.DataFrame}  -- [New ALS export]
+      df_rating {pd.DataFrame}  -- [Ratings (unchanged)]
+    Keyword Arguments:
+      users_num {int}           -- [Users kept per product]
+      items_num {int}           -- [Items kept per user]
+    Returns:
+      graph {CustomerGraph}     -- [Refreshed graph]
+      changed {int}             -- [Number of products added, removed or changed]
+    """
+    products = self._products(df_item, users_num)
+    product_ids, digests = products[0], products[4]
+    rows = self._product_rows.rows(product_ids)
+    same = (rows >= 0) & (self.digests[np.maximum(rows, 0)] == digests) if len(self.digests) else np.zeros(len(rows), dtype=bool)
+    # Added or changed, plus removed
+    changed = int(len(product_ids) - same.sum() + len(self.product_ids) - (rows >= 0).sum())
+    # Histories: keep the users still referenced, compute the new ones
+    user_ids = np.unique(products[2])
+    known = self._user_rows.rows(user_ids)
+    kept = known[known >= 0]
+    new_hist = self._histories(df_rating, user_ids[known < 0], items_num)
+    kept_ranges = _ranges(self.item_offsets[kept], self.item_offsets[kept + 1] - self.item_offsets[kept])
+    hist_user_ids = np.r_[self.hist_user_ids[kept], new_hist[0]]
+    counts = np.r_[np.diff(self.item_offsets)[kept], np.diff(new_hist[1])]
+    items = np.r_[self.items[kept_ranges], new_hist[2]]
+    item_ratings = np.r_[self.item_ratings[kept_ranges], new_hist[3]]
+    # Back to user order
+    order = np.argsort(hist_user_ids, kind='stable')
+    item_offsets = np.r_[0, np.cumsum(counts)].astype(np.int64)
+    item_order = _ranges(item_offsets[order], counts[order])
+    graph = CustomerGraph(*products, hist_user_ids[order], np.r_[0, np.cumsum(counts[order])].astype(np.int64),
+                          items[item_order], item_ratings[item_order])
+    return graph, changed
+
+  def has_product(self, product_id):
+    """Check whether a product is in the ALS export"""
+    return self._product_rows.rows([product_id])[0] >= 0
+
+  def lookup(self, product_ids, recs_num=GRAPH_USERS_NUM, threshold=-np.inf):
+    """Get the top users of several products and the top rated items of those users
+    Parameters
+    ----------
+    Arguments:
+      product_ids {list}          -- [Product IDs]
+    Keyword Arguments:
+      recs_num    {int}           -- [Users per product, at most the users_num of the build (GRAPH_USERS_NUM)]
+      threshold   {float}         -- [Minimum predicted rating]
+    Returns:
+      recs      {pd.DataFrame}    -- [product_id, user_id, rating, by product then rating descending]
+      histories {pd.DataFrame}    -- [user_id, product_id, rating, users in order of first appearance in recs]
+    """
+    rows = self._product_rows.rows(product_ids)
+    rows = rows[rows >= 0]
+    starts = self.user_offsets[rows]
+    lengths = np.minimum(self.user_offsets[rows + 1] - starts, recs_num)
+    idx = _ranges(starts, lengths)
+    product_ids_ = np.repeat(self.product_ids[rows], lengths)
+    # Users are sorted by rating descending: the ones above the threshold are a prefix
+    keep = self.user_ratings[idx] >= threshold
+    recs = pd.DataFrame({'product_id' : product_ids_[keep],
+                         'user_id'    : self.users[idx][keep],
+                         'rating'     : self.user_ratings[idx][keep]})
+    user_rows = self._user_rows.rows(pd.unique(recs['user_id'].to_numpy()))
+    user_rows = user_rows[user_rows >= 0]
+    starts = self.item_offsets[user_rows]
+    lengths = self.item_offsets[user_rows + 1] - starts
+    idx = _ranges(starts, lengths)
+    histories = pd.DataFrame({'user_id'     : np.repeat(self.hist_user_ids[user_rows], lengths),
+                              'product_id'  : self.items[idx],
+                              'rating'      : self.item_ratings[idx]})
+    return recs, histories
+
+  def save(self, file_path):
+    """Write the arrays to an .npz file
+    Parameters
+    ----------
+    Arguments:
+      file_path {str}   -- [Output path]
+    """
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+      np.savez(file, **{name: getattr(self, name) for name in _ARRAYS})
+    os.replace(tmp_path, file_path)
+
+  @classmethod
+  def load(cls, file_path):
+    """Read a graph written by save
+    Parameters
+    ----------
+    Arguments:
+      file_path {str}       -- [Path of the .npz file]
+    Returns:
+      graph {CustomerGraph}
+    """
+    with np.load(file_path) as arrays:
+      return cls(*[arrays[name] for name in _ARRAYS])
+
+def load_or_build(file_path, item_path, rating_path, load_item, load_rating):
+  """Load the graph, refreshing it if the ALS export is newer and rebuilding it if the ratings are newer
+  Parameters
+  ----------
+  Arguments:
+    file_path   {str}       -- [Path of the .npz file]
+    item_path   {str}       -- [Path of the ALS export]
+    rating_path {str}       -- [Path of the ratings]
+    load_item   {callable}  -- [load_item() -> ALS export data frame]
+    load_rating {callable}  -- [load_rating() -> ratings data frame]
+  Returns:
+    graph {CustomerGraph}
+  """
+  mtime = os.path.getmtime(file_path) if os.path.exists(file_path) else None
+  if mtime is not None and mtime >= os.path.getmtime(rating_path):
+    graph = CustomerGraph.load(file_path)
+    if mtime >= os.path.getmtime(item_path):
+      return graph
+    graph, _ = graph.refresh(load_item(), load_rating())
+  else:
+    graph = CustomerGraph.build(load_item(), load_rating())
+  try:
+    graph.save(file_path)
+  except OSError:
+    # Read-only deployment: serve the graph from memory
+    pass
+  return graph
+
+def main():
+  parser = argparse.ArgumentParser(description='Build or refresh the related-customers graph')
+  parser.add_argument('--out', default='./Data/customer_graph.npz', help='Output path of the graph')
+  args = parser.parse_args()
+  import utils
+  ds = utils.get_data_store()
+  graph = load_or_build(args.out, utils.ItemRecFilePath, utils.ProductRatingFilePath,
+                        lambda: ds.df_item, lambda: ds.df_rating)
+  print(f'{args.out}: {len(graph.product_ids)} products, {len(graph.hist_user_ids)} users')
+
+if __name__ == '__main__':
+  main()
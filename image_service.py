@@ -0,0 +1,200 @@
+"""Image service for the product grids
+-------
+@note   Product images are fetched concurrently with a bounded thread pool, resized to thumbnails
+        and kept in a disk-backed LRU cache. Failed URLs are remembered so the fallback image is served right away.
+        Each process keeps its own LRU over the cache directory, so a cached path is checked before it is served:
+        the file may have been evicted by another worker.
+        A fetch in flight is shared by every session asking for the same URL.
+"""
+
+"""Import libraries"""
+import os
+import io
+import time
+import tempfile
+import hashlib
+import threading
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from PIL import Image
+
+"""Define global variables"""
+THUMBNAIL_DIR       = './.thumbnails/'
+THUMBNAIL_SIZE      = (200, 200)
+THUMBNAIL_CACHE_NUM = 2000
+FETCH_WORKERS       = 8
+FETCH_TIMEOUT       = 5.0
+FAILED_URL_TTL      = 3600.0
+
+def fetch_url(url, timeout=FETCH_TIMEOUT):
+  """Fetch the content of an URL
+  Parameters
+  ----------
+  Arguments:
+    url     {str}     -- [Image URL]
+    timeout {float}   -- [Timeout in seconds]
+  Returns:
+    content {bytes}   -- [Raw content]
+  """
+  request = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+  with urllib.request.urlopen(request, timeout=timeout) as response:
+    return response.read()
+
+"""Define ImageService class"""
+class ImageService:
+  def __init__(self, fallback_path, cache_dir=THUMBNAIL_DIR, max_items=THUMBNAIL_CACHE_NUM, workers=FETCH_WORKERS,
+               timeout=FETCH_TIMEOUT, size=THUMBNAIL_SIZE, failed_ttl=FAILED_URL_TTL, fetcher=fetch_url):
+    """Initialize the ImageService class
+    Parameters
+    ----------
+    Arguments:
+      fallback_path {str}     -- [Image served when an URL cannot be fetched]
+    Keyword Arguments:
+      cache_dir   {str}       -- [Directory of the thumbnails]
+      max_items   {int}       -- [Maximum number of thumbnails on disk]
+      workers     {int}       -- [Maximum number of concurrent fetches]
+      timeout     {float}     -- [Timeout of a fetch in seconds]
+      size        {tuple}     -- [Maximum thumbnail size (width, height)]
+      failed_ttl  {float}     -- [Seconds before a failed URL is retried]
+      fetcher     {callable}  -- [fetcher(url, timeout) -> bytes, e.g. to point at a local HTTP stand-in]
+    """
+    self.fallback_path  = fallback_path
+    self.cache_dir      = cache_dir
+    self.max_items      = max_items
+    self.timeout        = timeout
+    self.size           = size
+    self.failed_ttl     = failed_ttl
+    self.fetcher        = fetcher
+    self._lock          = threading.Lock()
+    self._pool          = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image')
+    self._failed        = {}
+    # url key -> future of the fetch in flight
+    self._inflight      = {}
+    # LRU of url key -> thumbnail path, the oldest first
+    self._lru           = OrderedDict()
+    os.makedirs(cache_dir, exist_ok=True)
+    thumbnails = [os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith('.jpg')]
+    for path in sorted(thumbnails, key=os.path.getmtime):
+      self._lru[os.path.basename(path)[:-4]] = path
+
+  def key(self, url):
+    """Get the cache key of an URL
+    Parameters
+    ----------
+    Arguments:
+      url {str}   -- [Image URL]
+    Returns:
+      key {str}   -- [Cache key]
+    """
+    return hashlib.sha1(url.encode('utf8')).hexdigest()
+
+  def lookup(self, url):
+    """Get the thumbnail of an URL without fetching it
+    Parameters
+    ----------
+    Arguments:
+      url {str}     -- [Image URL]
+    Returns:
+      path {str}    -- [Thumbnail path, fallback path if the URL is invalid or failed recently, None if not cached]
+    """
+    if not isinstance(url, str) or not url.startswith(('http://', 'https://')):
+      return self.fallback_path
+    key = self.key(url)
+    with self._lock:
+      failed_at = self._failed.get(key)
+      if failed_at is not None:
+        if time.monotonic() - failed_at < self.failed_ttl:
+          return self.fallback_path
+        del self._failed[key]
+      path = self._lru.get(key)
+      if path is None:
+        return None
+      # Another process sharing the cache directory may have evicted the file
+      if not os.path.exists(path):
+        del self._lru[key]
+        return None
+      self._lru.move_to_end(key)
+      return path
+
+  def fetch(self, url):
+    """Fetch an URL and store its thumbnail
+    Parameters
+    ----------
+    Arguments:
+      url {str}     -- [Image URL]
+    Returns:
+      path {str}    -- [Thumbnail path, fallback path if the fetch failed]
+    """
+    key = self.key(url)
+    path = os.path.join(self.cache_dir, key + '.jpg')
+    try:
+      content = self.fetcher(url, self.timeout)
+      image = Image.open(io.BytesIO(content))
+      image.thumbnail(self.size)
+      # Write to a unique file then rename, so a reader never sees a partial file
+      fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+      try:
+        with os.fdopen(fd, 'wb') as file:
+          image.convert('RGB').save(file, format='JPEG', quality=85)
+        os.replace(tmp_path, path)
+      except BaseException:
+        os.remove(tmp_path)
+        raise
+    except Exception:
+      with self._lock:
+        self._failed[key] = time.monotonic()
+        self._inflight.pop(key, None)
+      return self.fallback_path
+    with self._lock:
+      self._lru[key] = path
+      self._lru.move_to_end(key)
+      self._inflight.pop(key, None)
+      evicted = []
+      while len(self._lru) > self.max_items:
+        evicted.append(self._lru.popitem(last=False)[1])
+    for old_path in evicted:
+      try:
+        os.remove(old_path)
+      except OSError:
+        pass
+    return path
+
+  def get(self, url):
+    """Get the thumbnail of an URL, fetching it if needed
+    Parameters
+    ----------
+    Arguments:
+      url {str}     -- [Image URL]
+    Returns:
+      path {str}    -- [Thumbnail path or fallback path]
+    """
+    return self.get_many([url])[0]
+
+  def get_many(self, urls):
+    """Get the thumbnails of several URLs, the missing ones are fetched concurrently
+    Parameters
+    ----------
+    Arguments:
+      urls {list}   -- [Image URLs]
+    Returns:
+      paths {list}  -- [Thumbnail path or fallback path of each URL]
+    """
+    paths = [self.lookup(url) for url in urls]
+    futures = {}
+    with self._lock:
+      for i, url in enumerate(urls):
+        if paths[i] is None and url not in futures:
+          # Join the fetch of another session rather than starting a second one
+          key = self.key(url)
+          future = self._inflight.get(key)
+          if future is None:
+            future = self._inflight[key] = self._pool.submit(self.fetch, url)
+          futures[url] = future
+    if futures:
+      wait(futures.values(), timeout=self.timeout * 2)
+    for i, url in enumerate(urls):
+      if paths[i] is None:
+        future = futures[url]
+        paths[i] = future.result() if future.done() else self.fallback_path
+    return paths
@@ -0,0 +1,212 @@
+"""Chunked ingestion of the CSV exports
+-------
+@note   Files are parsed CHUNK_ROWS rows at a time with declared dtypes, and only the columns used by the app are read.
+        Rows with a missing or out of range id or rating are dropped, logged once per file (warning with the file
+        name and the number of dropped rows) and counted (metric 'ingest.<file>.dropped'),
+        except in strict mode (catalog: its rows must stay aligned with the similarity index) where they raise.
+        Each chunk is appended to typed column buffers and handed to consumers that build their indexes
+        incrementally, so peak memory stays close to the final arrays plus one chunk.
+"""
+
+"""Import libraries"""
+import os
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import metrics as mx
+
+"""Define global variables"""
+CHUNK_ROWS          = 100_000
+ID_MAX              = int(np.iinfo(np.int32).max)
+# column: (dtype, min, max), 'str' columns are kept as Arrow strings and may be missing
+CATALOG_SCHEMA      = {
+  'product_id'                          : ('int32', 0, ID_MAX),
+  'product_name'                        : ('str', None, None),
+  'image'                               : ('str', None, None),
+  'link'                                : ('str', None, None),
+  'product_name_description_processed'  : ('str', None, None),
+}
+RATING_SCHEMA       = {
+  'product_id'  : ('int32', 0, ID_MAX),
+  'user_id'     : ('int32', 0, ID_MAX),
+  'user'        : ('str', None, None),
+  'rating'      : ('float32', 1.0, 5.0),
+}
+# ALS predictions are not bounded by the rating scale
+USER_REC_SCHEMA     = {
+  'user_id'     : ('int32', 0, ID_MAX),
+  'product_id'  : ('int32', 0, ID_MAX),
+  'rating'      : ('float32', -np.inf, np.inf),
+}
+ITEM_REC_SCHEMA     = {
+  'product_id'  : ('int32', 0, ID_MAX),
+  'user_id'     : ('int32', 0, ID_MAX),
+  'rating'      : ('float32', -np.inf, np.inf),
+}
+_READ_DTYPES        = {'int32': 'Int64', 'float32': 'Float64', 'str': pd.ArrowDtype(pa.string())}
+logger              = logging.getLogger(__name__)
+
+class IngestError(Exception):
+  """Raised when a file does not match its schema"""
+  pass
+
+def read_chunks(file_path, schema, sep=',', chunk_rows=CHUNK_ROWS, strict=False):
+  """Read a CSV file chunk by chunk, keeping the valid rows
+  Parameters
+  ----------
+  Arguments:
+    file_path   {str}   -- [CSV path]
+    schema      {dict}  -- [column: (dtype, min, max)]
+  Keyword Arguments:
+    sep         {str}   -- [Separator]
+    chunk_rows  {int}   -- [Rows per chunk]
+    strict      {bool}  -- [Raise IngestError on an invalid row instead of dropping it]
+  Returns:
+    chunks {iterator}   -- [Data frames with the schema columns and dtypes]
+  """
+  name = os.path.basename(file_path)
+  dtypes = {column: _READ_DTYPES[dtype] for column, (dtype, _, _) in schema.items()}
+  try:
+    reader = pd.read_csv(file_path, sep=sep, usecols=list(schema), dtype=dtypes, chunksize=chunk_rows, encoding='utf8')
+    with reader:
+      offset = dropped_total = 0
+      for chunk in reader:
+        valid = np.ones(len(chunk), dtype=bool)
+        for column, (dtype, min_value, max_value) in schema.items():
+          if dtype != 'str':
+            values = chunk[column]
+            valid &= ((values >= min_value) & (values <= max_value)).fillna(False).to_numpy(dtype=bool)
+        dropped = len(chunk) - int(valid.sum())
+        if dropped and strict:
+          row = offset + int(np.argmin(valid))
+          raise IngestError(f'{name}: row {row} has a missing or out of range value')
+        offset += len(chunk)
+        dropped_total += dropped
+        chunk = chunk[valid]
+        yield pd.DataFrame({column: chunk[column].array if dtype == 'str' else chunk[column].to_numpy(dtype=dtype)
+                            for column, (dtype, _, _) in schema.items()})
+      if dropped_total:
+        # Logged even when the metrics are disabled
+        logger.warning('%s: dropped %d of %d rows with a missing or out of range value', name, dropped_total, offset)
+        mx.count(f'ingest.{name}.dropped', dropped_total)
+  except ValueError as e:
+    # Missing column or value that cannot be parsed with the declared dtype
+    raise IngestError(f'{name}: {e}') from e
+
+def read_frame(file_path, schema, sep=',', consumers=(), chunk_rows=CHUNK_ROWS, strict=False):
+  """Read a whole CSV file chunk by chunk
+  Parameters
+  ----------
+  Arguments:
+    file_path   {str}   -- [CSV path]
+    schema      {dict}  -- [column: (dtype, min, max)]
+  Keyword Arguments:
+    sep         {str}   -- [Separator]
+    consumers   {list}  -- [consumer(chunk) called on every chunk, e.g. GroupStats.update]
+    chunk_rows  {int}   -- [Rows per chunk]
+    strict      {bool}  -- [Raise IngestError on an invalid row instead of dropping it]
+  Returns:
+    df {pd.DataFrame}   -- [Valid rows, numeric columns as numpy arrays, 'str' columns as Arrow strings]
+  """
+  buffers = {column: [] for column in schema}
+  for chunk in read_chunks(file_path, schema, sep, chunk_rows, strict):
+    for column, (dtype, _, _) in schema.items():
+      buffers[column].append(pa.array(chunk[column]) if dtype == 'str' else chunk[column].to_numpy())
+    for consumer in consumers:
+      consumer(chunk)
+  columns = {}
+  for column, (dtype, _, _) in schema.items():
+    if dtype == 'str':
+      columns[column] = pd.arrays.ArrowExtensionArray(pa.chunked_array(buffers[column], pa.string()))
+    else:
+      columns[column] = np.concatenate(buffers[column]) if buffers[column] else np.empty(0, dtype=dtype)
+    # Release the chunks as soon as the column is assembled
+    buffers[column] = None
+  return pd.DataFrame(columns)
+
+"""Define incremental indexes"""
+class GroupStats:
+  def __init__(self, key, value, aggs=('count', 'sum')):
+    """Aggregates of a value per key, updated chunk by chunk
+    Parameters
+    ----------
+    Arguments:
+      key   {str}   -- [Key column]
+      value {str}   -- [Value column]
+    Keyword Arguments:
+      aggs  {tuple} -- [Aggregates among count, sum, min, max]
+    """
+    self.key    = key
+    self.value  = value
+    self.aggs   = list(aggs)
+    self.stats  = None
+
+  def update(self, chunk):
+    """Add a chunk
+    Parameters
+    ----------
+    Arguments:
+      chunk {pd.DataFrame}  -- [Chunk with the key and value columns]
+    """
+    stats = chunk.groupby(self.key)[self.value].agg(self.aggs).astype(np.float64)
+    if self.stats is None:
+      self.stats = stats
+      return
+    stats, current = stats.align(self.stats, join='outer')
+    combined = {}
+    for agg in self.aggs:
+      if agg in ('count', 'sum'):
+        combined[agg] = stats[agg].fillna(0) + current[agg].fillna(0)
+      elif agg == 'min':
+        combined[agg] = np.fmin(stats[agg], current[agg])
+      else:
+        combined[agg] = np.fmax(stats[agg], current[agg])
+    self.stats = pd.DataFrame(combined)
+
+  def frame(self):
+    """Get the aggregates
+    Returns:
+      stats {pd.DataFrame}  -- [One row per key (sorted), one column per aggregate, plus mean if count and sum]
+    """
+    stats = self.stats if self.stats is not None else pd.DataFrame(columns=self.aggs, dtype=float)
+    if 'count' in stats:
+      stats = stats.astype({'count': np.int64})
+      if 'sum' in stats:
+        stats['mean'] = stats['sum'] / stats['count']
+    return stats.sort_index()
+
+class FirstValue:
+  def __init__(self, key, value):
+    """First value seen for each key, updated chunk by chunk
+    Parameters
+    ----------
+    Arguments:
+      key   {str}   -- [Key column]
+      value {str}   -- [Value column]
+    """
+    self.key    = key
+    self.value  = value
+    self.values = []
+    self._seen  = set()
+
+  def update(self, chunk):
+    """Add a chunk
+    Parameters
+    ----------
+    Arguments:
+      chunk {pd.DataFrame}  -- [Chunk with the key and value columns]
+    """
+    first = chunk[[self.key, self.value]].drop_duplicates(self.key)
+    first = first[~first[self.key].isin(self._seen)]
+    self._seen.update(first[self.key].tolist())
+    self.values.append(first)
+
+  def series(self):
+    """Get the first values
+    Returns:
+      values {pd.Series}  -- [Value indexed by key]
+    """
+    if not self.values:
+      return pd.Series(dtype=object, name=self.value)
+    return pd.concat(self.values, ignore_index=True).set_index(self.key)[self.value]
@@ -0,0 +1,160 @@
+"""Lightweight instrumentation of the recommendation hot paths
+-------
+@note   Records per-stage timings and counts (preprocessing steps, similarity scan, sort, rendering, ...).
+        Enabled with RECSYS_METRICS=1, the debug panel of app.py then shows them. When disabled, stage() returns
+        a shared no-op context and timed() only checks a flag, so the overhead is negligible.
+        Set RECSYS_METRICS_DUMP=<path> to write a JSON dump when the process exits.
+        A separate `startup` instance (RECSYS_PROFILE_STARTUP=1) records heavy imports and artifact loads,
+        see startup_profile.py.
+"""
+
+"""Import libraries"""
+import os
+import json
+import time
+import atexit
+import functools
+import threading
+import contextlib
+
+"""Define global variables"""
+METRICS_ENABLED     = os.environ.get('RECSYS_METRICS', '0') == '1'
+METRICS_DUMP_PATH   = os.environ.get('RECSYS_METRICS_DUMP', '')
+STARTUP_PROFILE     = os.environ.get('RECSYS_PROFILE_STARTUP', '0') == '1'
+_NULL_STAGE         = contextlib.nullcontext()
+
+"""Define Metrics class"""
+class Metrics:
+  def __init__(self, enabled=METRICS_ENABLED):
+    """Initialize the Metrics class
+    Parameters
+    ----------
+    Keyword Arguments:
+      enabled {bool}  -- [Record timings and counts] (default: {RECSYS_METRICS=1})
+    """
+    self.enabled  = enabled
+    self._lock    = threading.Lock()
+    self._stages  = {}
+    self._counts  = {}
+
+  def record(self, name, seconds):
+    """Record the duration of a stage
+    Parameters
+    ----------
+    Arguments:
+      name    {str}   -- [Stage name]
+      seconds {float} -- [Duration in seconds]
+    """
+    with self._lock:
+      stats = self._stages.get(name)
+      if stats is None:
+        self._stages[name] = [1, seconds, seconds, seconds]
+      else:
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = min(stats[2], seconds)
+        stats[3] = max(stats[3], seconds)
+
+  def count(self, name, n=1):
+    """Increase a counter
+    Parameters
+    ----------
+    Arguments:
+      name  {str}   -- [Counter name]
+    Keyword Arguments:
+      n     {int}   -- [Increment]
+    """
+    if not self.enabled:
+      return
+    with self._lock:
+      self._counts[name] = self._counts.get(name, 0) + n
+
+  @contextlib.contextmanager
+  def _stage(self, name):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.record(name, time.perf_counter() - start)
+
+  def stage(self, name):
+    """Time a block of code: `with metrics.stage('name'): ...`
+    Parameters
+    ----------
+    Arguments:
+      name {str}  -- [Stage name]
+    Returns:
+      context     -- [Context manager]
+    """
+    if not self.enabled:
+      return _NULL_STAGE
+    return self._stage(name)
+
+  def timed(self, name=None):
+    """Decorator timing every call of a function
+    Parameters
+    ----------
+    Keyword Arguments:
+      name {str}  -- [Stage name] (default: {function qualified name})
+    Returns:
+      decorator
+    """
+    def decorator(func):
+      stage_name = name or func.__qualname__
+      @functools.wraps(func)
+      def wrapper(*args, **kwargs):
+        if not self.enabled:
+          return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+          return func(*args, **kwargs)
+        finally:
+          self.record(stage_name, time.perf_counter() - start)
+      return wrapper
+    return decorator
+
+  def snapshot(self):
+    """Get the recorded metrics
+    Returns:
+      metrics {dict}  -- [{'stages': {name: count, total_ms, mean_ms, min_ms, max_ms}, 'counts': {name: n}}]
+    """
+    with self._lock:
+      stages = {name: {'count'    : c,
+                       'total_ms' : total * 1e3,
+                       'mean_ms'  : total * 1e3 / c,
+                       'min_ms'   : min_ * 1e3,
+                       'max_ms'   : max_ * 1e3}
+                for name, (c, total, min_, max_) in sorted(self._stages.items())}
+      counts = dict(sorted(self._counts.items()))
+    return {'enabled': self.enabled, 'timestamp': time.time(), 'pid': os.getpid(), 'stages': stages, 'counts': counts}
+
+  def to_json(self):
+    """Get the recorded metrics as a JSON string"""
+    return json.dumps(self.snapshot(), indent=2)
+
+  def dump(self, file_path):
+    """Write the recorded metrics to a JSON file
+    Parameters
+    ----------
+    Arguments:
+      file_path {str} -- [Output path]
+    """
+    with open(file_path, 'w', encoding='utf8') as file:
+      file.write(self.to_json())
+
+  def reset(self):
+    """Clear the recorded metrics"""
+    with self._lock:
+      self._stages.clear()
+      self._counts.clear()
+
+"""Process-wide instance"""
+metrics = Metrics()
+stage   = metrics.stage
+timed   = metrics.timed
+count   = metrics.count
+# Imports and artifact loads ('import.<module>', 'load.<artifact>')
+startup = Metrics(enabled=STARTUP_PROFILE)
+
+if METRICS_DUMP_PATH:
+  atexit.register(metrics.dump, METRICS_DUMP_PATH)
@@ -0,0 +1,84 @@
+"""Concurrent executor of the numeric query work
+-------
+@note   Each Streamlit session runs its script in its own thread. The numeric core of a content query
+        (sparse matrix-vector product over the TF-IDF index plus the top-k selection) runs on SciPy/NumPy
+        kernels that release the GIL, so several queries can use several cores at once.
+        The executor bounds that work: at most `workers` queries run and at most `queue_size` more wait.
+        When the queue is full, a caller waits up to `wait_s` for a slot and then gets ExecutorBusy
+        (backpressure) instead of piling up more work behind a saturated pool.
+        Calls run in the context of the caller, so they see the data store pinned by its script run.
+        Workers and queue size are set with RECSYS_QUERY_WORKERS and RECSYS_QUERY_QUEUE.
+@usage  executor = QueryExecutor(workers=4); positions, scores = executor.run(func, *args)
+"""
+
+"""Import libraries"""
+import os
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import metrics as mx
+
+"""Define global variables"""
+QUERY_WORKERS       = int(os.environ.get('RECSYS_QUERY_WORKERS', '0')) or min(4, os.cpu_count() or 1)
+QUERY_QUEUE_SIZE    = int(os.environ.get('RECSYS_QUERY_QUEUE', '16'))
+QUERY_WAIT_S        = 2.0
+
+class ExecutorBusy(Exception):
+  """Raised when the executor queue stays full for longer than the wait time"""
+  pass
+
+class QueryExecutor:
+  def __init__(self, workers=QUERY_WORKERS, queue_size=QUERY_QUEUE_SIZE, wait_s=QUERY_WAIT_S):
+    """Thread pool with a bounded queue
+    Parameters
+    ----------
+    Keyword Arguments:
+      workers     {int}   -- [Number of threads running queries]
+      queue_size  {int}   -- [Number of queries waiting for a thread]
+      wait_s      {float} -- [Time a caller waits for a slot when the queue is full]
+    """
+    self.workers    = max(1, workers)
+    self.queue_size = max(0, queue_size)
+    self.wait_s     = wait_s
+    self._pool      = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='query')
+    # One slot per running or waiting query
+    self._slots     = threading.BoundedSemaphore(self.workers + self.queue_size)
+
+  def submit(self, func, *args):
+    """Queue a call
+    Parameters
+    ----------
+    Arguments:
+      func  {callable}  -- [Function to run in the pool]
+      args  {tuple}     -- [Arguments of func]
+    Returns:
+      future {Future}   -- [Result of func]
+    """
+    if not self._slots.acquire(timeout=self.wait_s):
+      mx.count('executor.rejected')
+      raise ExecutorBusy(f'{self.workers} queries running and {self.queue_size} waiting')
+    try:
+      future = self._pool.submit(contextvars.copy_context().run, func, *args)
+    except BaseException:
+      self._slots.release()
+      raise
+    future.add_done_callback(lambda _: self._slots.release())
+    mx.count('executor.submitted')
+    return future
+
+  def run(self, func, *args):
+    """Run a call in the pool and wait for its result
+    Parameters
+    ----------
+    Arguments:
+      func  {callable}  -- [Function to run in the pool]
+      args  {tuple}     -- [Arguments of func]
+    Returns:
+      result            -- [Return value of func]
+    """
+    with mx.stage('executor.run'):
+      return self.submit(func, *args).result()
+
+  def shutdown(self, wait=True):
+    """Stop the threads once the queued calls are done"""
+    self._pool.shutdown(wait=wait)
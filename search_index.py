@@ -0,0 +1,110 @@
+"""Prefix/token search index for the product and user selectors
+-------
+@note   Instead of sending every "id - name" label to the browser in a selectbox,
+        the labels are indexed on the server and only one page of matches is returned per query.
+"""
+
+"""Import libraries"""
+import bisect
+import regex
+import numpy as np
+
+"""Define global variables"""
+SEARCH_PAGE_SIZE    = 50
+TOKEN_PATTERN       = regex.compile(r'\w+')
+
+"""Define SearchIndex class"""
+class SearchIndex:
+  def __init__(self, labels):
+    """Build the index over a list of labels ("id - name")
+    Parameters
+    ----------
+    Arguments:
+      labels {list}   -- [Labels to be searched, the order is kept in the results]
+    """
+    self.labels     = np.asarray(labels, dtype=object)
+    postings        = {}
+    for i, label in enumerate(self.labels):
+      for token in self.tokenize(label):
+        postings.setdefault(token, []).append(i)
+    # Sorted vocabulary: a prefix maps to a contiguous range, found by binary search
+    self.vocab      = sorted(postings)
+    self.postings   = [np.unique(np.asarray(postings[token], dtype=np.int64)) for token in self.vocab]
+
+  def tokenize(self, text):
+    """Split text into lowercase tokens
+    Parameters
+    ----------
+    Arguments:
+      text {str}      -- [Input text]
+    Returns:
+      tokens {list}   -- [Tokens]
+    """
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+  def match_prefix(self, prefix):
+    """Get positions of labels having a token starting with prefix
+    Parameters
+    ----------
+    Arguments:
+      prefix {str}            -- [Token prefix]
+    Returns:
+      positions {np.ndarray}  -- [Sorted label positions]
+    """
+    lo = bisect.bisect_left(self.vocab, prefix)
+    hi = bisect.bisect_left(self.vocab, prefix + '\uffff', lo)
+    if lo == hi:
+      return np.empty(0, dtype=np.int64)
+    if hi - lo == 1:
+      return self.postings[lo]
+    return np.unique(np.concatenate(self.postings[lo:hi]))
+
+  def match(self, query):
+    """Get positions of labels matching every token of the query (as prefixes)
+    Parameters
+    ----------
+    Arguments:
+      query {str}             -- [Search text, e.g. ID or part of the name]
+    Returns:
+      positions {np.ndarray}  -- [Sorted label positions, all labels if query is empty]
+    """
+    tokens = self.tokenize(query)
+    if not tokens:
+      return np.arange(len(self.labels))
+    # Intersect starting from the smallest posting list
+    matches = sorted((self.match_prefix(token) for token in set(tokens)), key=len)
+    result = matches[0]
+    for positions in matches[1:]:
+      if len(result) == 0:
+        break
+      result = np.intersect1d(result, positions, assume_unique=True)
+    return result
+
+  def page(self, positions, page_num=0, page_size=SEARCH_PAGE_SIZE):
+    """Get one page of labels
+    Parameters
+    ----------
+    Arguments:
+      positions {np.ndarray}  -- [Label positions returned by match]
+      page_num  {int}         -- [Page number, starting from 0]
+      page_size {int}         -- [Number of labels per page]
+    Returns:
+      labels {list}           -- [Labels of the page]
+    """
+    start = page_num * page_size
+    return self.labels[positions[start:start + page_size]].tolist()
+
+  def search(self, query, page_num=0, page_size=SEARCH_PAGE_SIZE):
+    """Get one page of labels matching the query
+    Parameters
+    ----------
+    Arguments:
+      query     {str}   -- [Search text]
+      page_num  {int}   -- [Page number, starting from 0]
+      page_size {int}   -- [Number of labels per page]
+    Returns:
+      labels  {list}    -- [Labels of the page]
+      total   {int}     -- [Number of matching labels]
+    """
+    positions = self.match(query)
+    return self.page(positions, page_num, page_size), len(positions)
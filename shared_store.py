@@ -0,0 +1,182 @@
+"""Read-only artifacts shared by several Streamlit worker processes
+-------
+@note   A loader process writes the large read-only artifacts once: the similarity index with its sparse arrays
+        as separate .npy files, numeric arrays as .npy files, and the catalog, rating and ALS frames as
+        uncompressed Arrow files. Workers started with RECSYS_SHARED_STORE=<dir> memory-map them, the pages
+        are shared through the OS page cache, so adding processes doesn't multiply memory.
+        The gensim dictionary and TF-IDF model are Python dicts: they are still loaded by each worker.
+        The loader runs once (not in each worker): every export is a new directory under <store>.exports and
+        <store> is a symlink switched atomically to it. A worker resolves the link when it starts, so the groups
+        it attaches later come from the same export; the last SHARED_KEEP exports are kept for such workers.
+@usage  python shared_store.py --out .shared (once)
+        RECSYS_SHARED_STORE=.shared streamlit run app.py (each worker)
+"""
+
+"""Import libraries"""
+import os
+import json
+import time
+import shutil
+import argparse
+import importlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import catalog_store as cs
+
+"""Define global variables"""
+SHARED_STORE_DIR    = '.shared'
+READY_FILE          = 'READY'
+# Groups of utils.DataStore written by the loader
+SHARED_GROUPS       = ['gensim_model', 'catalog', 'user_recs', 'item_recs', 'ratings', 'popularity', 'als_items']
+SHARED_KEEP         = 3
+
+def is_ready(shared_dir):
+  """Check whether a loader has finished writing the store
+  Parameters
+  ----------
+  Arguments:
+    shared_dir {str}  -- [Store directory]
+  Returns:
+    ready {bool}
+  """
+  return os.path.exists(os.path.join(shared_dir, READY_FILE))
+
+def has_group(shared_dir, group):
+  """Check whether a group was written to the store
+  Parameters
+  ----------
+  Arguments:
+    shared_dir  {str}   -- [Store directory]
+    group       {str}   -- [Group name]
+  Returns:
+    found {bool}
+  """
+  return os.path.exists(os.path.join(shared_dir, group + '.json'))
+
+def save_group(shared_dir, group, values):
+  """Write a group of artifacts
+  Parameters
+  ----------
+  Arguments:
+    shared_dir  {str}   -- [Store directory]
+    group       {str}   -- [Group name]
+    values      {dict}  -- [Attribute name -> value]
+  """
+  kinds = {}
+  for name, value in values.items():
+    path = os.path.join(shared_dir, f'{group}.{name}')
+    if isinstance(value, pd.DataFrame):
+      cs.write_table(pa.Table.from_pandas(value), path + '.arrow')
+      kinds[name] = 'frame'
+    elif isinstance(value, pd.Series):
+      cs.write_table(pa.Table.from_pandas(value.to_frame()), path + '.arrow')
+      kinds[name] = 'series'
+    elif isinstance(value, np.ndarray) and value.dtype != object:
+      np.save(path + '.npy', value)
+      kinds[name] = 'array'
+    elif isinstance(value, np.ndarray):
+      cs.write_table(pa.table({name: pa.array(value.tolist(), pa.string())}), path + '.arrow')
+      kinds[name] = 'labels'
+    elif hasattr(value, 'save') and type(value).__module__.startswith('gensim.'):
+      # Gensim objects: large arrays are stored in separate .npy files, which can be memory-mapped
+      value.save(path, sep_limit=0)
+      kinds[name] = f'gensim:{type(value).__module__}:{type(value).__name__}'
+    elif hasattr(value, 'save'):
+      # Objects of the app with save(path) / load(path), e.g. customer_graph.CustomerGraph
+      value.save(path + '.npz')
+      kinds[name] = f'object:{type(value).__module__}:{type(value).__name__}'
+    else:
+      raise TypeError(f'Cannot share {group}.{name} of type {type(value).__name__}')
+  with open(os.path.join(shared_dir, group + '.json'), 'w', encoding='utf8') as file:
+    json.dump(kinds, file, indent=2)
+
+def load_group(shared_dir, group):
+  """Attach to a group of artifacts (memory-mapped, read-only)
+  Parameters
+  ----------
+  Arguments:
+    shared_dir  {str}   -- [Store directory]
+    group       {str}   -- [Group name]
+  Returns:
+    values {dict}       -- [Attribute name -> value]
+  """
+  with open(os.path.join(shared_dir, group + '.json'), 'r', encoding='utf8') as file:
+    kinds = json.load(file)
+  values = {}
+  for name, kind in kinds.items():
+    path = os.path.join(shared_dir, f'{group}.{name}')
+    if kind == 'frame':
+      values[name] = cs.to_frame(cs.map_table(path + '.arrow'))
+    elif kind == 'series':
+      values[name] = cs.to_frame(cs.map_table(path + '.arrow')).iloc[:, 0]
+    elif kind == 'array':
+      values[name] = np.load(path + '.npy', mmap_mode='r')
+    elif kind == 'labels':
+      # Python strings cannot be shared, the labels are rebuilt from the mapped buffer
+      labels = cs.map_table(path + '.arrow').column(0).to_numpy(zero_copy_only=False).astype(object)
+      labels.setflags(write=False)
+      values[name] = labels
+    elif kind.startswith('object:'):
+      _, module, cls = kind.split(':')
+      values[name] = getattr(importlib.import_module(module), cls).load(path + '.npz')
+    else:
+      _, module, cls = kind.split(':')
+      values[name] = getattr(importlib.import_module(module), cls).load(path, mmap='r')
+  return values
+
+def _prune(exports_dir, keep, current):
+  # Oldest complete exports first; the current one is always kept
+  exports = [e for e in os.listdir(exports_dir) if is_ready(os.path.join(exports_dir, e)) and not e.endswith('.tmp')]
+  exports.sort(key=lambda e: os.path.getmtime(os.path.join(exports_dir, e, READY_FILE)), reverse=True)
+  for export_ in exports[keep:]:
+    if os.path.join(exports_dir, export_) != current:
+      shutil.rmtree(os.path.join(exports_dir, export_), ignore_errors=True)
+
+def export(store, shared_dir=SHARED_STORE_DIR, groups=SHARED_GROUPS, keep=SHARED_KEEP):
+  """Load the artifacts once and write a new export, then point the store at it
+  Parameters
+  ----------
+  Arguments:
+    store {utils.DataStore} -- [Data store loading from the original files]
+  Keyword Arguments:
+    shared_dir  {str}       -- [Store path (a symlink to the current export)]
+    groups      {list}      -- [Groups to write]
+    keep        {int}       -- [Number of exports to keep]
+  Returns:
+    path {str}              -- [Directory of the new export]
+  """
+  shared_dir = shared_dir.rstrip(os.sep)
+  exports_dir = shared_dir + '.exports'
+  # Unique even if several loaders run at the same time
+  path = os.path.join(exports_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}')
+  tmp_dir = path + '.tmp'
+  os.makedirs(tmp_dir)
+  try:
+    for group in groups:
+      save_group(tmp_dir, group, store.load(group))
+    open(os.path.join(tmp_dir, READY_FILE), 'w').close()
+    os.rename(tmp_dir, path)
+  except BaseException:
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    raise
+  # Replacing a symlink is atomic: a worker sees either the previous export or the new one, never a partial one
+  link_tmp = f'{shared_dir}.link-{os.getpid()}'
+  os.symlink(os.path.relpath(path, os.path.dirname(os.path.abspath(shared_dir))), link_tmp)
+  if os.path.isdir(shared_dir) and not os.path.islink(shared_dir):
+    # Plain directory written by an earlier version of this script, replaced once
+    shutil.rmtree(shared_dir)
+  os.replace(link_tmp, shared_dir)
+  _prune(exports_dir, keep, path)
+  return path
+
+def main():
+  parser = argparse.ArgumentParser(description='Write the artifacts shared by the app workers')
+  parser.add_argument('--out', default=SHARED_STORE_DIR, help='Store directory')
+  args = parser.parse_args()
+  import utils
+  export(utils.DataStore(shared_dir=''), args.out)
+  print(f'{args.out}: {", ".join(SHARED_GROUPS)}')
+
+if __name__ == '__main__':
+  main()
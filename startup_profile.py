@@ -0,0 +1,90 @@
+"""Startup profile of the app
+-------
+@note   Measures, in a fresh process, the import time of the app modules and the load time of each artifact
+        (gensim models, catalog, ALS exports, ...) that a page needs on its first run.
+        Heavy libraries and artifacts are deferred in utils.py, so `import utils` alone should stay cheap.
+        The same profile is shown in the app debug panel with RECSYS_PROFILE_STARTUP=1.
+@usage  python startup_profile.py --pages content,collaborative --out startup_profile.json
+"""
+
+"""Import libraries"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+
+"""Define global variables"""
+# Modules imported by app.py at startup, in import order
+APP_MODULES     = ['numpy', 'pandas', 'streamlit', 'metrics', 'search_index', 'utils']
+# page: artifact groups of utils.DataStore (or lazily imported modules) used by its first run
+PAGES           = {
+  'content'       : ['preprocess_lib', 'gensim_dictionary', 'gensim_tfidf', 'gensim_model', 'catalog'],
+  'collaborative' : ['user_recs', 'item_recs', 'ratings', 'catalog', 'user_labels', 'item_labels',
+                     'popularity', 'als_items'],
+  'voice'         : ['voice_input'],
+  'images'        : ['image_service'],
+}
+
+def profile(pages):
+  """Profile the imports then the first run of the pages
+  Parameters
+  ----------
+  Arguments:
+    pages {list}      -- [Page names in PAGES]
+  Returns:
+    result {dict}     -- [{'imports': {module: ms}, 'stages': {name: ms}, 'total_ms': ms}]
+  """
+  os.environ['RECSYS_PROFILE_STARTUP'] = '1'
+  started = time.perf_counter()
+  imports = {}
+  for name in APP_MODULES:
+    start = time.perf_counter()
+    importlib.import_module(name)
+    imports[name] = (time.perf_counter() - start) * 1e3
+  utils = sys.modules['utils']
+  store = utils.get_data_store()
+  for page in pages:
+    for name in PAGES[page]:
+      if name == 'preprocess_lib':
+        utils.get_preprocess_lib()
+      elif name in utils._STORE_GROUPS.values():
+        store.load(name)
+      else:
+        utils.lazy_import(name)
+  stages = {name: stats['total_ms'] for name, stats in sys.modules['metrics'].startup.snapshot()['stages'].items()}
+  return {'imports': imports, 'stages': stages, 'total_ms': (time.perf_counter() - started) * 1e3}
+
+def report(result):
+  """Print a profile, the slowest entries first
+  Parameters
+  ----------
+  Arguments:
+    result {dict}   -- [Result of profile]
+  """
+  print('{:<36}{:>12}'.format('import', 'ms'))
+  for name, ms in result['imports'].items():
+    print('{:<36}{:>12.1f}'.format(name, ms))
+  print('{:<36}{:>12}'.format('deferred import / load', 'ms'))
+  for name, ms in sorted(result['stages'].items(), key=lambda x: -x[1]):
+    print('{:<36}{:>12.1f}'.format(name, ms))
+  print('{:<36}{:>12.1f}'.format('total', result['total_ms']))
+
+def main():
+  parser = argparse.ArgumentParser(description='Startup profile of the app')
+  parser.add_argument('--pages', default='content,collaborative', help='Comma separated pages: ' + ','.join(PAGES))
+  parser.add_argument('--out', default='', help='Write the profile to a JSON file')
+  args = parser.parse_args()
+  pages = [page for page in args.pages.split(',') if page]
+  for page in pages:
+    if page not in PAGES:
+      parser.error(f'Unknown page: {page}')
+  result = profile(pages)
+  report(result)
+  if args.out:
+    with open(args.out, 'w', encoding='utf8') as file:
+      json.dump(result, file, indent=2)
+
+if __name__ == '__main__':
+  main()
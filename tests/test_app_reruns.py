@@ -0,0 +1,81 @@
+"""Regression test of the engine calls made per rerun of the app
+-------
+@note   Runs app.py with Streamlit's AppTest on a small synthetic dataset (benchmark.generate_data) and counts the
+        ProductRecommendations.* calls recorded by metrics.py: a plain rerun must not call the engine, and changing
+        the number of recommendations must only recompute the results of the page on screen.
+@usage  python -m pytest -q tests
+"""
+
+"""Import libraries"""
+import os
+import sys
+import pytest
+
+"""Define global variables"""
+REPO_PATH       = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PRODUCTS_NUM    = 2_000
+RATINGS_NUM     = 20_000
+APP_TIMEOUT     = 300
+# The selectors fetch their search index on every run: a lookup of the index built once per data store
+SELECTOR_CALLS  = {'get_product_search_index', 'get_user_search_index', 'get_item_search_index'}
+sys.path.insert(0, REPO_PATH)
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+  """AppTest of app.py running on a synthetic dataset, with the metrics enabled"""
+  AppTest = pytest.importorskip('streamlit.testing.v1').AppTest
+  import benchmark
+  work_dir = str(tmp_path_factory.mktemp('app'))
+  benchmark.generate_data(work_dir, PRODUCTS_NUM, RATINGS_NUM)
+  os.symlink(os.path.join(REPO_PATH, 'Misc'), os.path.join(work_dir, 'Misc'))
+  cwd = os.getcwd()
+  # utils.py loads its data from the working directory, on first use
+  os.chdir(work_dir)
+  import metrics as mx
+  mx.metrics.enabled = True
+  try:
+    yield AppTest.from_file(os.path.join(REPO_PATH, 'app.py'), default_timeout=APP_TIMEOUT).run()
+  finally:
+    mx.metrics.enabled = False
+    os.chdir(cwd)
+
+def engine_calls():
+  """Number of calls of each ProductRecommendations method so far (selector index lookups excluded)"""
+  import metrics as mx
+  stages = mx.metrics.snapshot()['stages']
+  return {name.split('.')[-1]: stats['count'] for name, stats in stages.items()
+          if name.startswith('ProductRecommendations.') and name.split('.')[-1] not in SELECTOR_CALLS}
+
+def new_calls(before, after):
+  return {name: count - before.get(name, 0) for name, count in after.items() if count != before.get(name, 0)}
+
+def search(app):
+  [button for button in app.button if button.label == 'Search'][0].click().run()
+
+@pytest.mark.parametrize('page', ['User-based Filtering', 'Item-based Filtering', 'Hybrid Filtering'])
+def test_engine_calls_per_rerun(app, page):
+  app.sidebar.radio[0].set_value('Collaborative Filtering').run()
+  app.sidebar.selectbox[0].set_value(page).run()
+  search(app)
+  assert not app.exception
+  before = engine_calls()
+  markdown_num = len(app.markdown)
+
+  # Plain rerun: results come from the session state
+  app.run()
+  assert not app.exception
+  assert new_calls(before, engine_calls()) == {}
+  assert len(app.markdown) == markdown_num
+
+  # Slider change: only the results of this page are recomputed
+  before = engine_calls()
+  slider = [s for s in app.slider if s.label == 'Number of Recommendations'][0]
+  slider.set_value(3 if slider.value != 3 else 4)
+  search(app)
+  assert not app.exception
+  calls = new_calls(before, engine_calls())
+  expected = {'User-based Filtering'  : {'get_rec_user_items'},
+              'Item-based Filtering'  : {'get_rec_item_users', 'get_rec_items_users'},
+              'Hybrid Filtering'      : {'get_hybrid_recs'}}[page]
+  assert set(calls) <= expected | {'get_product_info'}
+  assert set(calls) & expected
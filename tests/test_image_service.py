@@ -0,0 +1,100 @@
+"""Image service against a local HTTP stand-in
+-------
+@note   Serves a generated image with http.server, so fetches, thumbnails, failures and the cache directory
+        shared by several processes are checked without network access.
+@usage  python -m pytest -q tests
+"""
+
+"""Import libraries"""
+import io
+import os
+import sys
+import time
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import pytest
+
+"""Define global variables"""
+REPO_PATH       = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FALLBACK_PATH   = os.path.join(REPO_PATH, 'Misc', 'No_Image_Available.jpg')
+IMAGE_SIZE      = (640, 480)
+sys.path.insert(0, REPO_PATH)
+
+@pytest.fixture(scope='module')
+def server():
+  """Local HTTP server: /<name>.png returns an image, anything else a 404; requests are counted by path"""
+  Image = pytest.importorskip('PIL.Image')
+  buffer = io.BytesIO()
+  Image.new('RGB', IMAGE_SIZE, (200, 50, 50)).save(buffer, format='PNG')
+  content = buffer.getvalue()
+  requests = {}
+
+  class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+      requests[self.path] = requests.get(self.path, 0) + 1
+      if not self.path.endswith('.png'):
+        self.send_error(404)
+        return
+      self.send_response(200)
+      self.send_header('Content-Type', 'image/png')
+      self.send_header('Content-Length', str(len(content)))
+      self.end_headers()
+      self.wfile.write(content)
+
+    def log_message(self, *args):
+      pass
+
+  httpd = HTTPServer(('127.0.0.1', 0), Handler)
+  thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+  thread.start()
+  try:
+    yield f'http://127.0.0.1:{httpd.server_port}', requests
+  finally:
+    httpd.shutdown()
+
+def test_fetch_and_fallback(server, tmp_path):
+  import image_service as isv
+  from PIL import Image
+  base_url, requests = server
+  service = isv.ImageService(FALLBACK_PATH, cache_dir=str(tmp_path))
+  ok_url, missing_url = f'{base_url}/a.png', f'{base_url}/missing'
+  path, fallback = service.get_many([ok_url, missing_url, 'not an url'])[:2]
+  assert fallback == FALLBACK_PATH
+  with Image.open(path) as image:
+    assert image.size[0] <= isv.THUMBNAIL_SIZE[0] and image.size[1] <= isv.THUMBNAIL_SIZE[1]
+  # Served from the cache, and the failed URL is not retried before failed_ttl
+  assert service.get_many([ok_url, missing_url]) == [path, FALLBACK_PATH]
+  assert requests['/a.png'] == 1 and requests['/missing'] == 1
+  assert [f for f in os.listdir(tmp_path) if not f.endswith('.jpg')] == []
+
+def test_concurrent_fetches_shared(server, tmp_path):
+  import image_service as isv
+  base_url, _ = server
+  calls = []
+
+  def slow_fetcher(url, timeout):
+    calls.append(url)
+    time.sleep(0.3)
+    return isv.fetch_url(url, timeout)
+
+  service = isv.ImageService(FALLBACK_PATH, cache_dir=str(tmp_path), fetcher=slow_fetcher)
+  results = []
+  threads = [threading.Thread(target=lambda: results.append(service.get(f'{base_url}/b.png'))) for _ in range(4)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert len(calls) == 1
+  assert len(set(results)) == 1 and results[0] != FALLBACK_PATH
+
+def test_evicted_by_another_process(server, tmp_path):
+  import image_service as isv
+  base_url, _ = server
+  first = isv.ImageService(FALLBACK_PATH, cache_dir=str(tmp_path), max_items=1)
+  path = first.get(f'{base_url}/c.png')
+  # A second worker on the same directory evicts the thumbnail of the first one
+  second = isv.ImageService(FALLBACK_PATH, cache_dir=str(tmp_path), max_items=1)
+  second.get(f'{base_url}/d.png')
+  assert not os.path.exists(path)
+  assert first.lookup(f'{base_url}/c.png') is None
+  assert os.path.exists(first.get(f'{base_url}/c.png'))
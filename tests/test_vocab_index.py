@@ -0,0 +1,44 @@
+"""Mapping of the query tokens against the shipped gensim dictionary
+-------
+@note   In the shipped dictionary the unaccented forms "ao", "quan" and "giay" are dictionary tokens themselves,
+        so a query typed without diacritics must be mapped even when all its tokens are known.
+@usage  python -m pytest -q tests
+"""
+
+"""Import libraries"""
+import os
+import sys
+import pytest
+
+"""Define global variables"""
+REPO_PATH       = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DICTIONARY_PATH = os.path.join(REPO_PATH, 'gensim_dictionary.dict')
+sys.path.insert(0, REPO_PATH)
+
+@pytest.fixture(scope='module')
+def index():
+  """VocabularyIndex of the shipped dictionary"""
+  corpora = pytest.importorskip('gensim.corpora')
+  pytest.importorskip('underthesea')
+  import vocab_index
+  import vnmese_txt_preprocess_lib as vtp
+  unsign_table = str.maketrans(vtp.uniChars, vtp.unsignChars)
+  return vocab_index.VocabularyIndex.build(corpora.Dictionary.load(DICTIONARY_PATH), lambda text: text.translate(unsign_table))
+
+@pytest.mark.parametrize('tokens, expected', [
+  (['ao', 'thun', 'nam'],   ['áo_thun', 'nam']),
+  (['ao', 'khoac'],         ['áo_khoác']),
+  (['quan', 'jean'],        ['quần_jean']),
+  (['quan'],                ['quần']),
+  (['giay'],                ['giày']),
+])
+def test_unaccented_tokens(index, tokens, expected):
+  assert all(token in index.known for token in tokens)
+  assert index.map_tokens(tokens) == expected
+
+def test_accented_tokens_kept(index):
+  # "da" (leather) is not replaced by a more frequent accented form below ACCENT_DF_RATIO
+  assert index.map_tokens(['áo_thun', 'cotton', 'da']) == ['áo_thun', 'cotton', 'da']
+
+def test_typo(index):
+  assert index.map_tokens(['quanf']) == ['quần']
@@ -0,0 +1,74 @@
+"""Voice pipeline with recorded audio files and the offline recognizer
+-------
+@note   A short WAV file is generated with its sidecar transcript, so capture, recognition and the error
+        and timeout branches run without a microphone or network access.
+@usage  python -m pytest -q tests
+"""
+
+"""Import libraries"""
+import os
+import sys
+import time
+import wave
+import pytest
+
+"""Define global variables"""
+REPO_PATH       = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_RATE     = 16_000
+TRANSCRIPT      = 'áo thun nam'
+sys.path.insert(0, REPO_PATH)
+
+@pytest.fixture(scope='module')
+def vi():
+  pytest.importorskip('speech_recognition')
+  import voice_input
+  return voice_input
+
+@pytest.fixture(scope='module')
+def pipeline(vi):
+  return vi.VoicePipeline(vi.get_recognizer('offline'))
+
+def write_wav(file_path, transcript=None, seconds=0.2):
+  """Write a silent mono 16-bit WAV file, and its sidecar transcript when given"""
+  with wave.open(file_path, 'wb') as file:
+    file.setnchannels(1)
+    file.setsampwidth(2)
+    file.setframerate(SAMPLE_RATE)
+    file.writeframes(b'\x00\x00' * int(SAMPLE_RATE * seconds))
+  if transcript is not None:
+    with open(os.path.splitext(file_path)[0] + '.txt', 'w', encoding='utf8') as file:
+      file.write(transcript + '\n')
+  return file_path
+
+def test_listen_audio_file(vi, pipeline, tmp_path):
+  file_path = write_wav(str(tmp_path / 'query.wav'), TRANSCRIPT)
+  assert pipeline.listen(vi.AudioFileCapture(file_path)) == TRANSCRIPT
+  # Known transcripts take precedence over the sidecar file
+  recognizer = vi.OfflineRecognizer({file_path: 'quần jean'})
+  assert vi.VoicePipeline(recognizer).listen(vi.AudioFileCapture(file_path)) == 'quần jean'
+
+@pytest.mark.parametrize('transcript', [None, ''])
+def test_not_understood(vi, pipeline, tmp_path, transcript):
+  # Missing sidecar file, or empty transcript
+  file_path = write_wav(str(tmp_path / 'silence.wav'), transcript)
+  with pytest.raises(vi.VoiceInputError, match='Cannot understand'):
+    pipeline.listen(vi.AudioFileCapture(file_path))
+
+def test_missing_audio_file(vi, pipeline, tmp_path):
+  with pytest.raises(vi.VoiceInputError, match='Cannot capture audio'):
+    pipeline.listen(vi.AudioFileCapture(str(tmp_path / 'missing.wav')))
+
+def test_timeout(vi, pipeline, tmp_path):
+  file_path = write_wav(str(tmp_path / 'slow.wav'), TRANSCRIPT)
+
+  class SlowCapture(vi.AudioFileCapture):
+    def capture(self):
+      time.sleep(0.5)
+      return super().capture()
+
+  with pytest.raises(vi.VoiceInputError, match='timed out'):
+    pipeline.listen(SlowCapture(file_path), timeout=0.05)
+
+def test_unknown_recognizer(vi):
+  with pytest.raises(ValueError):
+    vi.get_recognizer('missing')
@@ -3,12 +3,21 @@
 # !pip install pyaudio
 # General libraries
 import streamlit as st
-import speech_recognition as sr
 import os
+import sys
+import functools
+import importlib
+import threading
+import contextvars
 import pandas as pd
 import numpy as np
-# Gemsim & Cosine Similarity
-from gensim import corpora, models, similarities
+# Server-side search for the selectors
+import search_index as si
+# Per-stage timings (RECSYS_METRICS=1) and startup profile (RECSYS_PROFILE_STARTUP=1)
+import metrics as mx
+# Thread pool running the numeric core of the content queries
+import query_executor as qx
+# Gensim, underthesea and speech_recognition are heavy: they are imported on first use (see lazy_import)
 
 
 
@@ -21,7 +30,9 @@ FinalFileName             = 'Products_ThoiTrangNam_raw_final.csv'
 GemsimDictName            = 'gensim_dictionary.dict'
 GensimTfidfName           = 'gensim_tfidf.tfidf'
 GemsimModelName           = 'gensim_model.model'
+CatalogStoreName          = 'catalog.arrow'
 FinalFilePath             = os.path.join(DataPath, FinalFileName)
+CatalogStorePath          = os.path.join(DataPath, CatalogStoreName)
 ProcessedFilePath         = os.path.join(DataPath, ProcessedFileName)
 RECS_NUM                  = 10
 DEF_SIMILARITY_THRESHOLD  = 0.4
@@ -32,6 +43,19 @@ DEF_RATING_THRESHOLD      = 3.0
 USER_ITEM_HIST_NUM        = 20
 TOP_USER_WITH_RATING_NUM  = 100
 
+# --- For Hybrid Filtering ---
+HYBRID_CONTENT_WEIGHT     = 0.5
+HYBRID_CF_WEIGHT          = 0.5
+HYBRID_CANDIDATES_NUM     = 200
+HYBRID_PROFILE_ITEMS_NUM  = 5
+
+# --- For Cold-start Fallback ---
+POPULARITY_PRIOR_COUNT    = 10
+COLD_START_CONTENT_WEIGHT = 0.7
+
+# --- For Query Filters ---
+FILTER_CACHE_NUM          = 256
+
 # --- For Collaborative Filtering ---
 ProductRatingFileName     = 'Products_ThoiTrangNam_rating_processed.csv'
 UserRecFileName           = 'UsrRecMatrix_.csv'
@@ -39,48 +63,420 @@ ItemRecFileName           = 'ItemRecMatrix_.csv'
 UserRecFilePath           = os.path.join(DataPath, UserRecFileName)
 ItemRecFilePath           = os.path.join(DataPath, ItemRecFileName)
 ProductRatingFilePath     = os.path.join(DataPath, ProductRatingFileName)
+CustomerGraphFilePath     = os.path.join(DataPath, 'customer_graph.npz')
+
+# --- Artifacts shared by the worker processes (written by shared_store.py) ---
+SharedStorePath           = os.environ.get('RECSYS_SHARED_STORE', '')
+# --- Versioned artifact bundle watched for new versions (written by artifact_bundle.py) ---
+BundlePath                = os.environ.get('RECSYS_BUNDLE', '')
 
 
 # ====================== Text processing ====================== #
 SPECIAL_WORDS = ['không', 'chẳng', 'chả']
-import vnmese_txt_preprocess_lib as vtp
-preprocess_lib = vtp.PreprocessLib()
+TEXT_CACHE_NUM = 1024
+
+def lazy_import(name):
+  """Import a module on first use, the import time is recorded in the startup profile
+  Parameters
+  ----------
+  Arguments:
+    name {str}        -- [Module name]
+  Returns:
+    module {module}   -- [Imported module]
+  """
+  module = sys.modules.get(name)
+  if module is None:
+    with mx.startup.stage('import.' + name):
+      module = importlib.import_module(name)
+  return module
 
+@functools.lru_cache(maxsize=1)
+def get_preprocess_lib():
+  # underthesea is only imported when the first description is preprocessed
+  lazy_import('underthesea')
+  vtp = lazy_import('vnmese_txt_preprocess_lib')
+  with mx.startup.stage('load.preprocess_lib'):
+    return vtp.PreprocessLib()
+
+# Repeated queries (e.g. the same voice input) skip the underthesea tokenization
+@functools.lru_cache(maxsize=TEXT_CACHE_NUM)
 def text_preprocessing(text):
-  text = preprocess_lib.process_text(text)
-  text = preprocess_lib.covert_unicode(text)
-  text = preprocess_lib.process_postag_thesea(text)
-  text = preprocess_lib.process_special_word(text, SPECIAL_WORDS)
-  text = preprocess_lib.remove_stopword(text)
+  mx.count('preprocess.cache_miss')
+  preprocess_lib = get_preprocess_lib()
+  with mx.stage('preprocess.process_text'):
+    text = preprocess_lib.process_text(text)
+  with mx.stage('preprocess.covert_unicode'):
+    text = preprocess_lib.covert_unicode(text)
+  with mx.stage('preprocess.process_postag_thesea'):
+    text = preprocess_lib.process_postag_thesea(text)
+  with mx.stage('preprocess.process_special_word'):
+    text = preprocess_lib.process_special_word(text, SPECIAL_WORDS)
+  with mx.stage('preprocess.remove_stopword'):
+    text = preprocess_lib.remove_stopword(text)
   return text
 
 
 # ====================== Load data ====================== #
 _INPUT  = ['product_id', 'product_name', 'image', 'link', 'product_name_description_processed']
-gemsim_dict  = corpora.Dictionary.load(GemsimDictName)
-gemsim_tfidf = models.TfidfModel.load(GensimTfidfName)
-gemsim_model = similarities.SparseMatrixSimilarity.load(GemsimModelName)
-data         = pd.read_csv(FinalFilePath, encoding='utf8')
-df           = data[_INPUT]
+_DISPLAY = ['product_name', 'image', 'link']
 
-# --- For Collaborative Filtering ---
 """
-@todo: Increase performance without loading data as global variables
+Models and data frames are loaded on first use instead of at import time, so each page only pays for what it uses.
 @ref: [Srteamlit Optimize Performance](https://docs.streamlit.io/library/api-reference/performance)
 """
-df_user   = pd.read_csv(UserRecFilePath, encoding='utf8', header=0)
-df_item   = pd.read_csv(ItemRecFilePath, encoding='utf8', header=0)
-df_rating = pd.read_csv(ProductRatingFilePath, encoding='utf8', header=0, sep='\t')
-# --- Process df_item ---
-df_item = df_item.sort_values(by=['product_id'])
-df_item_id_name = pd.merge(df_item, df, on='product_id', how='inner')
-df_item_id_name['id_name'] = df_item_id_name['product_id'].astype(str) + ' - ' + df_item_id_name['product_name']
-df_item_id_name = df_item_id_name[['product_id', 'product_name', 'id_name']]
-# --- Process df_user ---
-df_user = df_user.sort_values(by=['user_id'])
-df_user_id_name = pd.merge(df_user, df_rating, on='user_id', how='inner')
-df_user_id_name['id_name'] = df_user_id_name['user_id'].astype(str) + ' - ' + df_user_id_name['user']
-df_user_id_name = df_user_id_name[['user_id', 'user', 'id_name']]
+class DataStore:
+  def __init__(self, shared_dir=SharedStorePath, version=''):
+    """Initialize the DataStore class, nothing is loaded until an attribute is accessed
+    Parameters
+    ----------
+    Keyword Arguments:
+      shared_dir {str}  -- [Directory written by shared_store.py (or a version of the artifact bundle), the groups
+                            found there are memory-mapped instead of loaded] (default: {RECSYS_SHARED_STORE})
+      version    {str}  -- [Version of the artifact bundle, '' when loading the original files]
+    """
+    self.version    = version
+    self._lock      = threading.RLock()
+    self._groups    = {}
+    self._derived   = {}
+    self._resources = {}
+    self._shared    = None
+    if shared_dir:
+      shared_store = lazy_import('shared_store')
+      if shared_store.is_ready(shared_dir):
+        # Resolved once: groups attached later come from the same export even if the loader runs again
+        self._shared = (shared_store, os.path.realpath(shared_dir))
+      else:
+        st.warning(f'Shared store {shared_dir} is not ready, loading the original files')
+
+  def __getattr__(self, name):
+    group = _STORE_GROUPS.get(name)
+    if group is None:
+      raise AttributeError(name)
+    return self.load(group)[name]
+
+  def load(self, group):
+    """Load a group of artifacts once (thread-safe), the load time is recorded in the startup profile
+    Parameters
+    ----------
+    Arguments:
+      group {str}     -- [Group name, see _STORE_GROUPS]
+    Returns:
+      values {dict}   -- [Attribute name -> value]
+    """
+    values = self._groups.get(group)
+    if values is None:
+      with self._lock:
+        values = self._groups.get(group)
+        if values is None:
+          if self._shared is not None and self._shared[0].has_group(self._shared[1], group):
+            with mx.startup.stage('attach.' + group):
+              values = self._shared[0].load_group(self._shared[1], group)
+          else:
+            with mx.startup.stage('load.' + group):
+              values = getattr(self, '_load_' + group)()
+          self._check_rows(group, values)
+          self._groups[group] = values
+    return values
+
+  def _check_rows(self, group, values):
+    # Positions, masks and similarity scores all index df and gemsim_model.index by row: they must have the same rows
+    catalog = values if group == 'catalog' else self._groups.get('catalog')
+    model = values if group == 'gensim_model' else self._groups.get('gensim_model')
+    if catalog is None or model is None:
+      return
+    rows, index_rows = len(catalog['df']), model['gemsim_model'].index.shape[0]
+    if rows != index_rows:
+      raise lazy_import('ingest').IngestError(f'The catalog has {rows} rows but the similarity index has {index_rows}')
+
+  def derived(self, key, build):
+    """Get a value derived from the artifacts (e.g. a filter mask), built once per store
+    Parameters
+    ----------
+    Arguments:
+      key   {tuple}     -- [Cache key]
+      build {callable}  -- [build() -> value]
+    Returns:
+      value
+    """
+    value = self._derived.get(key)
+    if value is None:
+      value = build()
+      with self._lock:
+        if len(self._derived) >= FILTER_CACHE_NUM:
+          self._derived.clear()
+        self._derived[key] = value
+    return value
+
+  def resource(self, name, build):
+    """Get a value built once from the artifacts of the store (e.g. a search index), kept as long as the store
+    Parameters
+    ----------
+    Arguments:
+      name  {str}       -- [Resource name]
+      build {callable}  -- [build(store) -> value]
+    Returns:
+      value
+    """
+    entry = self._resources.get(name)
+    if entry is None:
+      with self._lock:
+        entry = self._resources.get(name)
+        if entry is None:
+          entry = (build, build(self))
+          self._resources[name] = entry
+    return entry[1]
+
+  def warm(self, other):
+    """Load the groups and build the resources already used by another store, before replacing it
+    Parameters
+    ----------
+    Arguments:
+      other {DataStore} -- [Store in use]
+    """
+    for group in list(other._groups):
+      self.load(group)
+    for name, (build, _) in list(other._resources.items()):
+      self.resource(name, build)
+
+  def positions(self, product_ids_):
+    """Get row positions of product_ids in df (and in gemsim_model)
+    Parameters
+    ----------
+    Arguments:
+      product_ids_ {np.ndarray} -- [Product IDs]
+    Returns:
+      positions {np.ndarray}    -- [Row positions, -1 if product_id does not exist]
+    """
+    product_ids_ = np.asarray(product_ids_)
+    idx = np.searchsorted(self.product_ids_sort, product_ids_)
+    idx = np.clip(idx, 0, len(self.product_ids_sort) - 1)
+    found = self.product_ids_sort[idx] == product_ids_
+    return np.where(found, self.product_order[idx], -1)
+
+  # --- Content-based Filtering ---
+  def _load_gensim_dictionary(self):
+    corpora = lazy_import('gensim.corpora')
+    return {'gemsim_dict': corpora.Dictionary.load(GemsimDictName)}
+
+  def _load_gensim_tfidf(self):
+    models = lazy_import('gensim.models')
+    return {'gemsim_tfidf': models.TfidfModel.load(GensimTfidfName)}
+
+  def _load_gensim_model(self):
+    similarities = lazy_import('gensim.similarities')
+    return {'gemsim_model': similarities.SparseMatrixSimilarity.load(GemsimModelName)}
+
+  def _load_vocab_index(self):
+    # Accent-stripped, compound and one-edit lookups of the dictionary words (see vocab_index.py)
+    vocab_index = lazy_import('vocab_index')
+    return {'vocab_index': vocab_index.VocabularyIndex.build(self.gemsim_dict, get_preprocess_lib().remove_accents)}
+
+  def _load_catalog(self):
+    # Compact frame (int32 ids, Arrow strings) memory-mapped from the prebuilt store (see catalog_store.py)
+    df = lazy_import('catalog_store').load(FinalFilePath, CatalogStorePath, _INPUT)
+    # --- Product positions (row index in df / gemsim_model) aligned on product_id ---
+    product_ids = df['product_id'].to_numpy()
+    product_order = np.argsort(product_ids, kind='stable')
+    # --- Immutable id-name labels for the selectors ---
+    product_id_names = df['product_id'].astype(str).to_numpy(dtype=object) + ' - ' + df['product_name'].to_numpy(dtype=object)
+    product_id_names.setflags(write=False)
+    return {'df'                : df,
+            'product_ids'       : product_ids,
+            'product_order'     : product_order,
+            'product_ids_sort'  : product_ids[product_order],
+            'product_id_names'  : product_id_names}
+
+  # --- For Collaborative Filtering ---
+  # CSV exports are read in chunks with declared dtypes (see ingest.py), the indexes are built on the way
+  def _load_user_recs(self):
+    ingest = lazy_import('ingest')
+    df_user = ingest.read_frame(UserRecFilePath, ingest.USER_REC_SCHEMA)
+    return {'df_user': df_user.sort_values(by=['user_id'], kind='stable')}
+
+  def _load_item_recs(self):
+    ingest = lazy_import('ingest')
+    best_rating = ingest.GroupStats('product_id', 'rating', aggs=('max',))
+    df_item = ingest.read_frame(ItemRecFilePath, ingest.ITEM_REC_SCHEMA, consumers=[best_rating.update])
+    return {'df_item'           : df_item.sort_values(by=['product_id'], kind='stable'),
+            'item_best_rating'  : best_rating.frame()['max']}
+
+  def _load_ratings(self):
+    ingest = lazy_import('ingest')
+    rating_stats = ingest.GroupStats('product_id', 'rating')
+    user_names = ingest.FirstValue('user_id', 'user')
+    df_rating = ingest.read_frame(ProductRatingFilePath, ingest.RATING_SCHEMA, sep='\t',
+                                  consumers=[rating_stats.update, user_names.update])
+    return {'df_rating'       : df_rating,
+            'user_name_by_id' : user_names.series(),
+            'rating_stats'    : rating_stats.frame()}
+
+  def _load_item_labels(self):
+    # Gather the labels of the products covered by the ALS export
+    pos = self.positions(self.df_item['product_id'].drop_duplicates().to_numpy())
+    item_id_names = self.product_id_names[pos[pos >= 0]]
+    item_id_names.setflags(write=False)
+    return {'item_id_names': item_id_names}
+
+  def _load_user_labels(self):
+    df_user_id_name = pd.merge(self.df_user[['user_id']].drop_duplicates(), self.user_name_by_id.reset_index(),
+                               on='user_id', how='inner')
+    user_id_names = (df_user_id_name['user_id'].astype(str) + ' - ' + df_user_id_name['user']).drop_duplicates()
+    user_id_names = user_id_names.to_numpy(dtype=object)
+    user_id_names.setflags(write=False)
+    return {'user_id_names': user_id_names}
+
+  def _load_customer_graph(self):
+    # Product -> (top users, their top rated items), built offline by customer_graph.py
+    customer_graph = lazy_import('customer_graph')
+    graph = customer_graph.load_or_build(CustomerGraphFilePath, ItemRecFilePath, ProductRatingFilePath,
+                                         lambda: self.df_item, lambda: self.df_rating)
+    return {'customer_graph': graph}
+
+  # --- For Cold-start Fallback ---
+  def _load_popularity(self):
+    # Popularity vectors sorted by score descending
+    # Bayesian average: shrink the mean rating of rarely rated products to the global mean
+    rating_stats = self.rating_stats
+    rating_mean = rating_stats['sum'].sum() / max(rating_stats['count'].sum(), 1)
+    pop_scores = ((rating_stats['count'] * rating_stats['mean'] + POPULARITY_PRIOR_COUNT * rating_mean)
+                  / (rating_stats['count'] + POPULARITY_PRIOR_COUNT)).to_numpy()
+    pop_order = np.argsort(-pop_scores, kind='stable')
+    pop_product_ids = rating_stats.index.to_numpy()[pop_order]
+    pop_scores = pop_scores[pop_order]
+    # Normalized popularity aligned on df rows (0 for products without rating)
+    pop_score_by_pos = np.zeros(len(self.product_ids))
+    pop_pos = self.positions(pop_product_ids)
+    pop_score_by_pos[pop_pos[pop_pos >= 0]] = pop_scores[pop_pos >= 0] / max(pop_scores.max(initial=0), 1e-9)
+    return {'pop_product_ids'   : pop_product_ids,
+            'pop_avg_rating'    : rating_stats['mean'].to_numpy()[pop_order],
+            'pop_scores'        : pop_scores,
+            'pop_score_by_pos'  : pop_score_by_pos}
+
+  def _load_als_items(self):
+    # Products covered by the ALS export (df_item), aligned on df rows
+    als_item_ids = self.df_item['product_id'].unique()
+    als_item_mask = np.zeros(len(self.product_ids), dtype=bool)
+    als_pos = self.positions(als_item_ids)
+    als_item_mask[als_pos[als_pos >= 0]] = True
+    # Best predicted ALS rating of each product (-inf if not covered)
+    best_rating = self.item_best_rating
+    als_rating_by_pos = np.full(len(self.product_ids), -np.inf)
+    best_pos = self.positions(best_rating.index.to_numpy())
+    als_rating_by_pos[best_pos[best_pos >= 0]] = best_rating.to_numpy()[best_pos >= 0]
+    return {'als_item_ids': als_item_ids, 'als_item_mask': als_item_mask, 'als_rating_by_pos': als_rating_by_pos}
+
+# Attribute name -> group of artifacts loaded together
+_STORE_GROUPS = {
+  'gemsim_dict'       : 'gensim_dictionary',
+  'gemsim_tfidf'      : 'gensim_tfidf',
+  'gemsim_model'      : 'gensim_model',
+  'vocab_index'       : 'vocab_index',
+  'df'                : 'catalog',
+  'product_ids'       : 'catalog',
+  'product_order'     : 'catalog',
+  'product_ids_sort'  : 'catalog',
+  'product_id_names'  : 'catalog',
+  'df_user'           : 'user_recs',
+  'df_item'           : 'item_recs',
+  'item_best_rating'  : 'item_recs',
+  'df_rating'         : 'ratings',
+  'user_name_by_id'   : 'ratings',
+  'rating_stats'      : 'ratings',
+  'customer_graph'    : 'customer_graph',
+  'item_id_names'     : 'item_labels',
+  'user_id_names'     : 'user_labels',
+  'pop_product_ids'   : 'popularity',
+  'pop_avg_rating'    : 'popularity',
+  'pop_scores'        : 'popularity',
+  'pop_score_by_pos'  : 'popularity',
+  'als_item_ids'      : 'als_items',
+  'als_item_mask'     : 'als_items',
+  'als_rating_by_pos' : 'als_items',
+}
+
+def open_data_store(bundle_dir=BundlePath, version=None):
+  """Open a data store on a verified version of the artifact bundle (the first version is built when there is none),
+  or on the original files without a bundle
+  Parameters
+  ----------
+  Keyword Arguments:
+    bundle_dir  {str}     -- [Bundle directory, '' to load the original files] (default: {RECSYS_BUNDLE})
+    version     {str}     -- [Version name (default: CURRENT)]
+  Returns:
+    store {DataStore}
+  """
+  if not bundle_dir:
+    return DataStore()
+  artifact_bundle = lazy_import('artifact_bundle')
+  version = version or artifact_bundle.current_version(bundle_dir)
+  if version is None:
+    # First start on this filesystem: build the first version once, the workers starting together wait for it
+    try:
+      with mx.startup.stage('bundle.build'):
+        version = artifact_bundle.ensure(bundle_dir, lambda: DataStore(shared_dir=''))
+    except Exception as e:
+      st.warning(f'Artifact bundle {bundle_dir} has no current version and cannot be built ({e}), loading the original files')
+      return DataStore()
+  with mx.startup.stage('bundle.verify'):
+    shared_dir = artifact_bundle.open_version(bundle_dir, version)
+  return DataStore(shared_dir=shared_dir, version=version)
+
+_data_store = open_data_store()
+# Store pinned by the current script run, see pin_data_store
+_pinned_store = contextvars.ContextVar('pinned_store', default=None)
+_query_executor = qx.QueryExecutor()
+
+def get_data_store():
+  """Get the data store pinned by the current script run, otherwise the data store of the process"""
+  store = _pinned_store.get()
+  return _data_store if store is None else store
+
+def pin_data_store():
+  """Serve the current data store until the end of the script run, even if a new version is swapped in meanwhile
+  Returns:
+    store {DataStore}
+  """
+  store = _data_store
+  _pinned_store.set(store)
+  return store
+
+def swap_data_store(version):
+  """Open and warm up a version of the artifact bundle, then make it the data store of the process
+  Parameters
+  ----------
+  Arguments:
+    version {str}     -- [Version name]
+  Returns:
+    store {DataStore} -- [New store, the next script runs pin it]
+  """
+  global _data_store
+  store = open_data_store(BundlePath, version)
+  # Load what the sessions already use, so the first run on the new version doesn't wait for it
+  with mx.stage('bundle.warm'):
+    store.warm(_data_store)
+  _data_store = store
+  mx.count('bundle.swap')
+  return store
+
+def get_query_executor():
+  """Get the query executor shared by the sessions of the process"""
+  return _query_executor
+
+# New versions of the artifact bundle are swapped in by a background thread
+_bundle_watcher = None
+if BundlePath:
+  _bundle_watcher = lazy_import('artifact_bundle').BundleWatcher(BundlePath, _data_store.version, swap_data_store)
+  _bundle_watcher.start()
+
+def get_bundle_watcher():
+  """Get the artifact bundle watcher, None without a bundle"""
+  return _bundle_watcher
+
+def __getattr__(name):
+  # Keep utils.df, utils.df_user, ... working (loaded on first access)
+  if name in _STORE_GROUPS:
+    return getattr(get_data_store(), name)
+  raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 
@@ -92,19 +488,295 @@ def make_clickable(link):
   text = 'link'
   return f'<a target="_blank" href="{link}">{text}</a>'
 
-def takecomand():
-  text = ''
-  r = sr.Recognizer()
-  with sr.Microphone() as source:
-    st.write("Tell me your product's ID or description ...")
-    r.adjust_for_ambient_noise(source)
-    audio = r.listen(source)
-    try:
-      text = r.recognize_google(audio, language="vi-VI")
-      st.write("Your input :", text)
-    except:
-      st.write("Please say again ..")
-    return text
+@st.cache_resource()
+def get_voice_pipeline():
+  # Shared by all sessions, the recognizer backend is chosen by VOICE_RECOGNIZER
+  return lazy_import('voice_input').VoicePipeline()
+
+def get_product_positions(product_ids_):
+  """Get row positions of product_ids in df (and in gemsim_model)
+  Parameters
+  ----------
+  Arguments:
+    product_ids_ {np.ndarray} -- [Product IDs]
+  Returns:
+    positions {np.ndarray}    -- [Row positions, -1 if product_id does not exist]
+  """
+  return get_data_store().positions(product_ids_)
+
+def get_product_values(product_ids_, column):
+  """Gather a column of df for a list of product_ids, without merging the whole frame
+  Parameters
+  ----------
+  Arguments:
+    product_ids_ {np.ndarray} -- [Product IDs]
+    column {str}              -- [Column name of df]
+  Returns:
+    values {np.ndarray}       -- [Values of the column, None if product_id does not exist]
+  """
+  ds = get_data_store()
+  pos = get_product_positions(product_ids_)
+  # Only the requested rows are converted to Python objects
+  values = ds.df[column].take(np.maximum(pos, 0)).to_numpy(dtype=object)
+  values[pos < 0] = None
+  return values
+
+def map_query_tokens(tokens, strict=False):
+  """Map the words typed without diacritics or with a typo to dictionary words (the index is built on first need)
+  Parameters
+  ----------
+  Arguments:
+    tokens {list}   -- [Tokens after text_preprocessing]
+  Keyword Arguments:
+    strict {bool}   -- [Return None when a token has no match, instead of dropping it]
+  Returns:
+    tokens {list}   -- [Dictionary tokens]
+  """
+  ds = get_data_store()
+  # Unaccented words are mapped even when known: "ao" is a dictionary token, but "áo" is what was meant
+  if all(token in ds.gemsim_dict.token2id and not token.isascii() for token in tokens):
+    return tokens
+  with mx.stage('content.map_tokens'):
+    return ds.vocab_index.map_tokens(tokens, strict)
+
+def get_query_vector(processed_description):
+  """Convert a processed description to a unit-length TF-IDF vector
+  Parameters
+  ----------
+  Arguments:
+    processed_description {str} -- [Description after text_preprocessing]
+  Returns:
+    vector {np.ndarray}         -- [Dense TF-IDF weights, one per dictionary term]
+  """
+  ds = get_data_store()
+  tokens = map_query_tokens(processed_description.split())
+  # Convert to bag of words
+  with mx.stage('content.doc2bow'):
+    corpus_ = ds.gemsim_dict.doc2bow(tokens)
+  # Calculate TF-IDF
+  with mx.stage('content.tfidf'):
+    corpus_tfidf_ = ds.gemsim_tfidf[corpus_]
+  index = ds.gemsim_model.index
+  vector = np.zeros(index.shape[1], dtype=index.dtype)
+  if corpus_tfidf_:
+    term_ids, weights = zip(*corpus_tfidf_)
+    vector[list(term_ids)] = weights
+    # Same normalization as the gensim index query
+    vector /= np.linalg.norm(vector)
+  return vector
+
+def get_similarity_scores(vector):
+  """Calculate the cosine similarity between a query vector and all products
+  Parameters
+  ----------
+  Arguments:
+    vector {np.ndarray} -- [Vector returned by get_query_vector]
+  Returns:
+    sims {np.ndarray}   -- [Similarity of each product, aligned on df rows]
+  """
+  # Sparse matrix-vector product (SciPy releases the GIL)
+  with mx.stage('content.similarity_scan'):
+    return get_data_store().gemsim_model.index @ vector
+
+def get_content_similarities(processed_description):
+  """Calculate similarity between a processed description and all products
+  Parameters
+  ----------
+  Arguments:
+    processed_description {str} -- [Description after text_preprocessing]
+  Returns:
+    sims {np.ndarray}           -- [Similarity of each product, aligned on df rows]
+  """
+  return get_similarity_scores(get_query_vector(processed_description))
+
+
+# ====================== Cold-start fallback ====================== #
+def get_popular_products(recs_num=USER_ITEM_RECS_NUM, threshold=DEF_RATING_THRESHOLD):
+  """Get the most popular products (Bayesian average rating) for unseen users
+  Parameters
+  ----------
+  Arguments:
+    recs_num  {int}           -- [Number of products]
+    threshold {float}         -- [Minimum popularity score]
+  Returns:
+    product_ids {np.ndarray}  -- [Product IDs, sorted by score descending]
+    scores      {np.ndarray}  -- [Popularity scores]
+  """
+  ds = get_data_store()
+  # pop_scores is sorted descending: the cut-off is a binary search
+  n = np.searchsorted(-ds.pop_scores, -threshold, side='right')
+  n = min(n, recs_num)
+  return ds.pop_product_ids[:n], ds.pop_scores[:n]
+
+def get_cold_start_neighbor(product_id, content_weight=COLD_START_CONTENT_WEIGHT):
+  """Get the closest product covered by the ALS export for an unseen product
+  Parameters
+  ----------
+  Arguments:
+    product_id     {int}    -- [Catalog product ID not covered by the ALS export]
+    content_weight {float}  -- [Weight of the content similarity, popularity gets the rest]
+  Returns:
+    product_id {int}        -- [Product ID covered by the ALS export, None if there is none or the product is not in the catalog]
+  """
+  ds = get_data_store()
+  pos = get_product_positions([product_id])[0]
+  # Products missing from the catalog do not exist, only catalog products get a neighbor
+  if pos < 0 or not ds.als_item_mask.any():
+    return None
+  scores = (1.0 - content_weight) * ds.pop_score_by_pos
+  # Blend with content similarity when the product has a description
+  description = ds.df['product_name_description_processed'].iat[pos]
+  if isinstance(description, str) and description:
+    scores = scores + content_weight * get_content_similarities(description)
+  scores = np.where(ds.als_item_mask, scores, -np.inf)
+  scores[pos] = -np.inf
+  return int(ds.product_ids[np.argmax(scores)])
+
+# ====================== Query filters ====================== #
+"""
+Filters are compiled to boolean masks aligned on df rows and applied in the top-k stage,
+so the similarity scan never has to be filtered row by row afterwards.
+"""
+class ProductFilter:
+  def __init__(self, keyword='', min_als_rating=None, exclude_ids=()):
+    """Initialize the ProductFilter class
+    Parameters
+    ----------
+    Keyword Arguments:
+      keyword         {str}   -- [Category keyword, every word must be in the product name or description]
+      min_als_rating  {float} -- [Minimum predicted ALS rating of the product, None to keep all]
+      exclude_ids     {tuple} -- [Product IDs to exclude]
+    """
+    self.keyword        = keyword.strip() if keyword else ''
+    self.min_als_rating = min_als_rating
+    self.exclude_ids    = tuple(exclude_ids)
+
+  def key(self):
+    """Get the inputs of the filter, used to cache its results"""
+    return (self.keyword, self.min_als_rating, self.exclude_ids)
+
+  def __eq__(self, other):
+    return isinstance(other, ProductFilter) and self.key() == other.key()
+
+  def __hash__(self):
+    return hash(self.key())
+
+  def is_empty(self):
+    """Check whether the filter keeps every product"""
+    return not self.keyword and self.min_als_rating is None and not self.exclude_ids
+
+  def exclude(self, product_ids_):
+    """Get a copy of the filter also excluding product_ids
+    Parameters
+    ----------
+    Arguments:
+      product_ids_ {list}     -- [Product IDs to exclude]
+    Returns:
+      filter_ {ProductFilter}
+    """
+    return ProductFilter(self.keyword, self.min_als_rating, self.exclude_ids + tuple(product_ids_))
+
+  def matches_nothing(self):
+    """Check whether the filter removes every product (e.g. a keyword found in no product)"""
+    mask = self.mask()
+    return mask is not None and not mask.any()
+
+  def mask(self):
+    """Compile the filter
+    Returns:
+      mask {np.ndarray}   -- [Boolean mask aligned on df rows, None if the filter keeps every product]
+    """
+    if self.is_empty():
+      return None
+    ds = get_data_store()
+    mask = np.ones(len(ds.product_ids), dtype=bool)
+    if self.keyword:
+      mask &= get_keyword_mask(self.keyword)
+    if self.min_als_rating is not None:
+      mask &= get_als_rating_mask(self.min_als_rating)
+    if self.exclude_ids:
+      pos = get_product_positions(list(self.exclude_ids))
+      mask[pos[pos >= 0]] = False
+    return mask
+
+def get_keyword_mask(keyword):
+  """Get products containing every word of a keyword (cached per keyword)
+  Parameters
+  ----------
+  Arguments:
+    keyword {str}       -- [Keyword, preprocessed and mapped like the queries]
+  Returns:
+    mask {np.ndarray}   -- [Read-only boolean mask aligned on df rows]
+  """
+  ds = get_data_store()
+  def build():
+    # A word without any match in the dictionary matches no product
+    tokens = map_query_tokens(text_preprocessing(keyword).split(), strict=True)
+    term_ids = [ds.gemsim_dict.token2id.get(token) for token in tokens or []]
+    if not term_ids or None in term_ids:
+      mask = np.zeros(len(ds.product_ids), dtype=bool)
+    else:
+      # Rows of the similarity index are the TF-IDF vectors of the products
+      mask = np.asarray((ds.gemsim_model.index[:, term_ids] > 0).sum(axis=1)).ravel() == len(set(term_ids))
+    mask.setflags(write=False)
+    return mask
+  return ds.derived(('keyword', keyword), build)
+
+def get_als_rating_mask(min_als_rating):
+  """Get products whose best predicted ALS rating is at least min_als_rating (cached per value)
+  Parameters
+  ----------
+  Arguments:
+    min_als_rating {float}  -- [Minimum predicted rating]
+  Returns:
+    mask {np.ndarray}       -- [Read-only boolean mask aligned on df rows]
+  """
+  ds = get_data_store()
+  def build():
+    mask = ds.als_rating_by_pos >= min_als_rating
+    mask.setflags(write=False)
+    return mask
+  return ds.derived(('min_als_rating', float(min_als_rating)), build)
+
+def get_top_k(scores, k, threshold=-np.inf, mask=None):
+  """Get the positions of the k best scores
+  Parameters
+  ----------
+  Arguments:
+    scores    {np.ndarray}  -- [Scores aligned on df rows]
+    k         {int}         -- [Number of positions]
+  Keyword Arguments:
+    threshold {float}       -- [Minimum score]
+    mask      {np.ndarray}  -- [Boolean mask of the allowed positions, None to allow all]
+  Returns:
+    positions {np.ndarray}  -- [Positions sorted by score descending (then by position)]
+  """
+  allowed = scores >= threshold
+  if mask is not None:
+    allowed &= mask
+  candidates = np.flatnonzero(allowed)
+  if len(candidates) > k:
+    candidates = np.sort(candidates[np.argpartition(-scores[candidates], k - 1)[:k]])
+  return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+def get_similar_top_k(vector, k, threshold=-np.inf, mask=None):
+  """Get the k products most similar to a query vector (numeric core run by the query executor)
+  Parameters
+  ----------
+  Arguments:
+    vector    {np.ndarray}  -- [Vector returned by get_query_vector]
+    k         {int}         -- [Number of products]
+  Keyword Arguments:
+    threshold {float}       -- [Minimum similarity]
+    mask      {np.ndarray}  -- [Boolean mask of the allowed positions, None to allow all]
+  Returns:
+    positions {np.ndarray}  -- [Positions sorted by similarity descending]
+    sims      {np.ndarray}  -- [Similarity of each position]
+  """
+  sims = get_similarity_scores(vector)
+  with mx.stage('content.sort'):
+    positions = get_top_k(sims, k, threshold, mask)
+  return positions, sims[positions]
 
 # ====================== Product Recommendations ====================== #
 
@@ -119,27 +791,24 @@ class ProductRecommendations:
     # self.df           = self.data[_INPUT]
     pass
     
-  def recommend_products(self, desc_, recs_num=RECS_NUM, threshold=DEF_SIMILARITY_THRESHOLD):
+  @mx.timed()
+  def recommend_products(self, desc_, recs_num=RECS_NUM, threshold=DEF_SIMILARITY_THRESHOLD, filter_=None, exclude_query=True):
     """_summary_
     Parameters
     ----------
     Arguments:
         desc_     (str): Product ID or description
         recs_num  (int): Number of recommendations
+        filter_   (ProductFilter): Constraints on the recommended products
+        exclude_query (bool): Exclude the product itself when desc_ is a product ID
     -------
     Returns:
     list
         List of recommended products
     """
+    ds = get_data_store()
     # Input product_id or description
     input_text  = desc_
-    # dict_       = self.gemsim_dict
-    # tfidf_      = self.gemsim_tfidf
-    # index_      = self.gemsim_model
-    # df          = self.df
-    dict_ = gemsim_dict
-    tfidf_ = gemsim_tfidf
-    index_ = gemsim_model
     
     with st.spinner('Searching ...'):
       # Check if input_text is empty
@@ -153,57 +822,68 @@ class ProductRecommendations:
         # Input is product_id
         product_id = int(input_text)
         # Check if product_id exists
-        if product_id not in df.product_id.values:
+        pos = get_product_positions([product_id])[0]
+        if pos < 0:
           st.error(f'Product ID {product_id} does not exist')
           # Return empty dataframe
           return pd.DataFrame(columns=['product_id', 'similarity', ])
         else:
           # Get product description
-          product_description = df[df.product_id == product_id].product_name_description_processed.values[0]
+          product_description = ds.df['product_name_description_processed'].iat[pos]
+          if exclude_query:
+            filter_ = (filter_ or ProductFilter()).exclude([product_id])
       else:
         # Input is product description
         product_description = input_text
 
       # Preprocess input text
-      processed_description = text_preprocessing(product_description)
+      with mx.stage('content.text_preprocessing'):
+        processed_description = text_preprocessing(product_description)
       if not input_text.isdigit():
         st.success('Input description after preprocessing: {}'.format(processed_description))
-      # Convert to bag of words
-      corpus_ = dict_.doc2bow(processed_description.split())
-      # Calculate TF-IDF
-      corpus_tfidf_ = tfidf_[corpus_]
-      # Calculate similarity
-      sims = index_[corpus_tfidf_]
-      # Sort similarity
-      sims = sorted(enumerate(sims), key=lambda item: -item[1])
-      # Only get similarity >= threshold
-      sims = [s for s in sims if s[1] >= threshold]
-      # Get top similar products
-      top_similar_products = sims[:recs_num]
+      vector = get_query_vector(processed_description)
+      with mx.stage('content.filter'):
+        mask = filter_.mask() if filter_ is not None else None
+      # Top similar products with similarity >= threshold, among the products kept by the filter
+      # Raises ExecutorBusy when the executor queue stays full (the caller must not cache that outcome)
+      top_pos, top_sims = get_query_executor().run(get_similar_top_k, vector, recs_num, threshold, mask)
     
     # Return top similar products inform of dataframe of product_id, similarity
-    df_ = pd.DataFrame(columns=['product_id', 'similarity', ])
-    for i, (product_id, similarity) in enumerate(top_similar_products):
-      df_ = pd.concat([df_, pd.DataFrame({'product_id': [df.iloc[product_id].product_id], 'similarity': [similarity]})], ignore_index=True)
+    with mx.stage('content.assemble'):
+      df_ = pd.DataFrame({'product_id': ds.product_ids[top_pos], 'similarity': top_sims})
     return df_
   
 
-  def get_product_info(self, df_, on_):
+  @mx.timed()
+  def get_product_info(self, df_, on_, columns_=None):
     """_summary_
     Parameters
     ----------
     Arguments:
         df  (dataframe): Dataframe contains column to merge
         on  (str): Column name to merge
+        columns_  (list): Columns of the catalog to add (default: product name, image, link)
     -------
     Returns:
     list
         Product name, image, link, description
     """
-    df_ = pd.merge(df_, df, on=on_)
+    ds = get_data_store()
+    if columns_ is None:
+      columns_ = _DISPLAY
+    if on_ != 'product_id':
+      return pd.merge(df_, ds.df[[on_] + [c for c in columns_ if c != on_]], on=on_)
+    # Gather only the rows needed (inner join on product_id) instead of merging with the whole catalog
+    pos = get_product_positions(df_[on_].to_numpy())
+    df_ = df_[pos >= 0].reset_index(drop=True)
+    rows = ds.df.take(pos[pos >= 0])
+    for column in columns_:
+      if column != on_:
+        df_[column] = rows[column].array
     return df_
   
 
+  @mx.timed()
   def get_product_info_(self, product_id):
     """_summary_
     Parameters
@@ -215,17 +895,18 @@ class ProductRecommendations:
     list
         Product name, image, link, description
     """
+    ds = get_data_store()
     # Check if product_id exists
-    if product_id not in df.product_id.values:
+    pos = get_product_positions([product_id])
+    if pos[0] < 0:
       st.error(f'Product ID {product_id} does not exist')
       return None
     else:
-      df_ = df[df.product_id == product_id]      
+      df_ = ds.df.take(pos)
       return df_
     
 
-  """The cached result is returned instead of re-computing the result."""
-  @st.cache_data()
+  @mx.timed()
   def get_product_id_name_list(_self):
     """ Get list of product_id and product_name
     Parameters
@@ -236,11 +917,12 @@ class ProductRecommendations:
     list
         List of product_id and product_name
     """
-    # Return list of product_id and product_name in a same line
-    df['id_name'] = df['product_id'].astype(str) + ' - ' + df['product_name']
-    return df['id_name']
+    ds = get_data_store()
+    # Labels are precomputed (read-only) when the catalog is loaded
+    return ds.product_id_names
   
   
+  @mx.timed()
   def get_product_id_name_list_(_self, item_id):
     """ Get list of product_id and product_name
     Parameters
@@ -252,15 +934,61 @@ class ProductRecommendations:
     list
         List of product_id and product_name
     """
+    ds = get_data_store()
     # Check if item_id exists
-    if item_id not in df.product_id.values:
+    pos = get_product_positions([item_id])
+    if pos[0] < 0:
       return None
     # Return list of product_id and product_name in a same line
-    df_ = df[df.product_id == item_id]
-    df_['id_name'] = df_['product_id'].astype(str) + ' - ' + df_['product_name']
-    return df_['id_name']
+    return pd.Series(ds.product_id_names[pos], index=ds.df.index[pos], name='id_name')
   
 
+  """The index is built once per data store and shared by all sessions instead of re-building it."""
+  @mx.timed()
+  def get_product_search_index(_self):
+    """ Get search index over product_id and product_name
+    Parameters
+    ----------
+    Arguments:
+    -------
+    Returns:
+    SearchIndex
+        Index of product_id and product_name labels
+    """
+    return get_data_store().resource('product_search_index', lambda ds: si.SearchIndex(ds.product_id_names))
+
+
+  """The index is built once per data store and shared by all sessions instead of re-building it."""
+  @mx.timed()
+  def get_user_search_index(_self):
+    """ Get search index over user_id and user_name (collaborative filtering)
+    Parameters
+    ----------
+    Arguments:
+    -------
+    Returns:
+    SearchIndex
+        Index of user_id and user_name labels
+    """
+    return get_data_store().resource('user_search_index', lambda ds: si.SearchIndex(ds.user_id_names))
+
+
+  """The index is built once per data store and shared by all sessions instead of re-building it."""
+  @mx.timed()
+  def get_item_search_index(_self):
+    """ Get search index over item_id and item_name (collaborative filtering)
+    Parameters
+    ----------
+    Arguments:
+    -------
+    Returns:
+    SearchIndex
+        Index of item_id and item_name labels
+    """
+    return get_data_store().resource('item_search_index', lambda ds: si.SearchIndex(ds.item_id_names))
+
+
+  @mx.timed()
   def get_top_user_rated_items(self, user_id, num_items=USER_ITEM_HIST_NUM):
     """ Get top user rated items
     Parameters
@@ -273,14 +1001,16 @@ class ProductRecommendations:
     list
         List of user ratings information
     """
-    df_rating_ = df_rating[df_rating.user_id == user_id].sort_values(by='rating', ascending=False)[:num_items]
+    ds = get_data_store()
+    df_rating_ = ds.df_rating[ds.df_rating.user_id == user_id].sort_values(by='rating', ascending=False)[:num_items].copy()
     # get product_name
-    df_rating_['product_name'] = df_rating_['product_id'].apply(lambda x: df[df.product_id == x]['product_name'].values[0])
+    df_rating_['product_name'] = get_product_values(df_rating_['product_id'], 'product_name')
     # get link
-    df_rating_['link'] = df_rating_['product_id'].apply(lambda x: df[df.product_id == x]['link'].values[0])
+    df_rating_['link'] = get_product_values(df_rating_['product_id'], 'link')
     return df_rating_
   
 
+  @mx.timed()
   def get_top_user_with_rating(self, num_users=TOP_USER_WITH_RATING_NUM):
     """ Get top users with rating
     Parameters
@@ -292,18 +1022,19 @@ class ProductRecommendations:
     list
         List of user ratings information
     """
+    ds = get_data_store()
     # get top users who rated most items, return user_id, user_name and number of ratings in a dataframe
-    df_rating_ = df_rating.groupby('user_id').count().sort_values(by='rating', ascending=False)[:num_users]
+    df_rating_ = ds.df_rating.groupby('user_id').count().sort_values(by='rating', ascending=False)[:num_users]
     df_rating_ = df_rating_.reset_index()
     df_rating_ = df_rating_.rename(columns={'rating': 'num_ratings'}) 
     # get user_name
-    df_rating_['user'] = df_rating_['user_id'].apply(lambda x: df_rating[df_rating.user_id == x]['user'].values[0])
+    df_rating_['user'] = df_rating_['user_id'].apply(lambda x: ds.df_rating[ds.df_rating.user_id == x]['user'].values[0])
     return df_rating_[['user_id', 'user', 'num_ratings']]
     # return df_rating_[['user_id', 'num_ratings']]
   
 
-  """The cached result is returned instead of re-computing the result."""
-  @st.cache_data()  
+  """The result is computed once per data store instead of re-computing the result."""
+  @mx.timed()
   def get_all_user_ids(_self):
     """ Get list of user_ids
     Parameters
@@ -314,13 +1045,16 @@ class ProductRecommendations:
     list
         List of user_ids
     """
-    userIds = df_user['user_id'].unique()
-    userIds.sort()
-    return userIds
+    def build(ds):
+      userIds = ds.df_user['user_id'].unique()
+      userIds.sort()
+      userIds.setflags(write=False)
+      return userIds
+    return get_data_store().resource('all_user_ids', build)
   
 
-  """The cached result is returned instead of re-computing the result."""
-  @st.cache_data()
+  """The labels are precomputed (read-only) when the data is loaded."""
+  @mx.timed()
   def get_all_user_ids_names(_self):
     """ Get list of user_ids and user_names based on df_user (collaborative filtering)
     Parameters
@@ -331,11 +1065,12 @@ class ProductRecommendations:
     list
         List of user_ids and user_names
     """
-    return df_user_id_name['id_name'].unique()
+    ds = get_data_store()
+    return ds.user_id_names
   
   
-  """The cached result is returned instead of re-computing the result."""
-  @st.cache_data()
+  """The result is computed once per data store instead of re-computing the result."""
+  @mx.timed()
   def get_all_item_ids(_self):
     """ Get list of item_ids
     Parameters
@@ -346,13 +1081,16 @@ class ProductRecommendations:
     list
         List of item_ids
     """
-    itemIds = df_item['product_id'].unique()
-    itemIds.sort()
-    return itemIds
+    def build(ds):
+      itemIds = ds.df_item['product_id'].unique()
+      itemIds.sort()
+      itemIds.setflags(write=False)
+      return itemIds
+    return get_data_store().resource('all_item_ids', build)
   
 
-  """The cached result is returned instead of re-computing the result."""
-  @st.cache_data()
+  """The labels are precomputed (read-only) when the data is loaded."""
+  @mx.timed()
   def get_all_item_ids_names(_self):
     """ Get list of item_ids and item_names based on df_item (collaborative filtering)
     Parameters
@@ -363,9 +1101,11 @@ class ProductRecommendations:
     list
         List of item_ids and item_names
     """
-    return df_item_id_name['id_name'].unique()
+    ds = get_data_store()
+    return ds.item_id_names
 
 
+  @mx.timed()
   def get_rec_user_items(self, user_id, recs_num=USER_ITEM_RECS_NUM, threshold=DEF_RATING_THRESHOLD):
     """ Get list of recommended items for a user
     Parameters
@@ -379,18 +1119,22 @@ class ProductRecommendations:
     list
         List of recommended items
     """
+    ds = get_data_store()
     # Check if user_id exists
-    if user_id not in df_user['user_id'].unique():
-      st.error(f'User ID {user_id} does not exist')
-      return
+    if user_id not in ds.df_user['user_id'].unique():
+      # Cold-start: fall back to the most popular products
+      st.info(f'User ID {user_id} has no ALS recommendations, showing popular products')
+      product_ids_, scores_ = get_popular_products(recs_num, threshold)
+      return pd.DataFrame({'user_id': user_id, 'product_id': product_ids_, 'rating': scores_})
     else:
       # Get list of recommended items
-      df_ = df_user[df_user.user_id == user_id].sort_values(by='rating', ascending=False)
+      df_ = ds.df_user[ds.df_user.user_id == user_id].sort_values(by='rating', ascending=False)
       df_ = df_[df_.rating >= threshold]
       df_ = df_[:recs_num]
       return df_
     
 
+  @mx.timed()
   def get_rec_item_users(self, product_id, recs_num=USER_ITEM_RECS_NUM, threshold=DEF_RATING_THRESHOLD):
     """ Get list of recommended users for an item
     Parameters
@@ -404,24 +1148,129 @@ class ProductRecommendations:
     list
         List of recommended users
     """
+    ds = get_data_store()
     # Check if product_id exists
-    if product_id not in df_item['product_id'].unique():
-      st.error(f'Product ID {product_id} does not exist')
-      return None
+    if not ds.customer_graph.has_product(product_id):
+      # Cold-start: use the potential customers of the closest product covered by ALS
+      neighbor_id = get_cold_start_neighbor(product_id)
+      if neighbor_id is None:
+        st.error(f'Product ID {product_id} does not exist')
+        return None
+      st.info(f'Product ID {product_id} has no ALS recommendations, using closest product {neighbor_id}')
+      return self.get_rec_item_users(neighbor_id, recs_num, threshold)
     else:
-      # Get list of recommended users
-      df_ = df_item[df_item.product_id == product_id].sort_values(by='rating', ascending=False)
-      df_ = df_[df_.rating >= threshold]
-      df_ = df_[:recs_num]
-      df_['user'] = df_['user_id'].apply(lambda x: df_rating[df_rating.user_id == x]['user'].values[0])
-      # --- For each user_id, get top 5 reated items of that user in df_rating ---
-      df_rating_ = pd.DataFrame()
-      for user_ in df_['user_id'].unique():
-        df_rating_top = df_rating[df_rating.user_id == user_].sort_values(by='rating', ascending=False)
-        df_rating_    = pd.concat([df_rating_, df_rating_top[:5]])
-      # get product_name
-      df_rating_['product_name'] = df_rating_['product_id'].apply(lambda x: df[df.product_id == x]['product_name'].values[0])
-      # get link and format as html link
-      df_rating_['link'] = df_rating_['product_id'].apply(lambda x: df[df.product_id == x]['link'].values[0])
-
-      return df_, df_rating_
\ No newline at end of file
+      return self.get_rec_items_users([product_id], recs_num, threshold)
+
+  @mx.timed()
+  def get_rec_items_users(self, product_ids_, recs_num=USER_ITEM_RECS_NUM, threshold=DEF_RATING_THRESHOLD):
+    """ Get recommended users of several items in one call (no cold-start fallback)
+    Parameters
+    ----------
+    Arguments:
+        product_ids_  (list): Product IDs
+        recs_num (int): Number of recommended users per product
+        threshold (float): Minimum rating to recommend
+    -------
+    Returns:
+    tuple
+        Recommended users (product_id, user_id, user, rating) and the top rated items of those users
+    """
+    ds = get_data_store()
+    customer_graph = lazy_import('customer_graph')
+    # Served from the precomputed graph instead of scanning df_item / df_rating
+    graph = ds.customer_graph
+    if recs_num > customer_graph.GRAPH_USERS_NUM:
+      # The graph keeps GRAPH_USERS_NUM users per product: larger requests are built from the ALS export
+      df_item_ = ds.df_item[ds.df_item['product_id'].isin(product_ids_)]
+      graph = customer_graph.CustomerGraph.build(df_item_, ds.df_rating, users_num=recs_num)
+    recs, hist = graph.lookup(product_ids_, recs_num, threshold)
+    # Assemble each frame in one go (column inserts dominate at this size)
+    df_ = pd.DataFrame({'product_id'  : recs['product_id'].to_numpy(),
+                        'user_id'     : recs['user_id'].to_numpy(),
+                        'user'        : ds.user_name_by_id.reindex(recs['user_id'].to_numpy()).to_numpy(),
+                        'rating'      : recs['rating'].to_numpy()})
+    df_rating_ = pd.DataFrame({'product_id'   : hist['product_id'].to_numpy(),
+                               'user_id'      : hist['user_id'].to_numpy(),
+                               'user'         : ds.user_name_by_id.reindex(hist['user_id'].to_numpy()).to_numpy(),
+                               'rating'       : hist['rating'].to_numpy(),
+                               'product_name' : get_product_values(hist['product_id'].to_numpy(), 'product_name'),
+                               'link'         : get_product_values(hist['product_id'].to_numpy(), 'link')})
+    return df_, df_rating_
+
+  @mx.timed()
+  def get_hybrid_recs(self, user_id, desc_='', recs_num=RECS_NUM, content_weight=HYBRID_CONTENT_WEIGHT, cf_weight=HYBRID_CF_WEIGHT,
+                      candidates_num=HYBRID_CANDIDATES_NUM):
+    """ Get list of recommended items for a user by blending content-based and collaborative scores
+    Parameters
+    ----------
+    Arguments:
+        user_id  (int): User ID
+        desc_ (str): Optional query text, the user's rating history is used when empty
+        recs_num (int): Number of recommendations
+        content_weight (float): Weight of the content similarity score
+        cf_weight (float): Weight of the ALS rating score
+        candidates_num (int): Number of top content matches added to the candidate set
+    -------
+    Returns:
+    dataframe
+        product_id, content_score, cf_score and fused score of the recommended items
+    """
+    ds = get_data_store()
+    # --- ALS candidates of the user ---
+    df_cf_    = ds.df_user[ds.df_user.user_id == user_id]
+    cf_ids    = df_cf_['product_id'].to_numpy()
+    cf_rating = df_cf_['rating'].to_numpy(dtype=float)
+    if len(cf_ids) == 0:
+      # Cold-start: popular products stand in for the ALS recommendations
+      cf_ids, cf_rating = get_popular_products(candidates_num, 0.0)
+
+    # Products the user already rated are never recommended back
+    df_user_rating_ = ds.df_rating[ds.df_rating.user_id == user_id]
+    rated_ids = np.unique(df_user_rating_['product_id'].to_numpy())
+
+    # --- Content query: input text, or the descriptions of the user's top rated items ---
+    if desc_:
+      processed_description = text_preprocessing(desc_)
+    else:
+      df_hist_ = df_user_rating_.nlargest(HYBRID_PROFILE_ITEMS_NUM, 'rating')
+      hist_pos = get_product_positions(df_hist_['product_id'].to_numpy())
+      hist_pos = hist_pos[hist_pos >= 0]
+      processed_description = ' '.join(ds.df['product_name_description_processed'].take(hist_pos).to_numpy(dtype=str))
+
+    sims = None
+    content_ids = np.empty(0, dtype=ds.product_ids.dtype)
+    if processed_description:
+      sims = get_content_similarities(processed_description)
+      # Only keep the top candidates_num matches (no full sort), plus room for the rated products dropped below
+      k = min(candidates_num + len(rated_ids), len(sims))
+      if k > 0:
+        top_pos = np.argpartition(-sims, k - 1)[:k]
+        content_ids = ds.product_ids[top_pos[sims[top_pos] > 0]]
+
+    # --- Candidate set aligned on product_id ---
+    candidates = np.setdiff1d(np.union1d(cf_ids, content_ids), rated_ids, assume_unique=True)
+    if len(candidates) == 0:
+      return pd.DataFrame(columns=['product_id', 'content_score', 'cf_score', 'score'])
+
+    # Content scores of the candidates
+    content_scores = np.zeros(len(candidates))
+    if sims is not None:
+      pos = get_product_positions(candidates)
+      content_scores[pos >= 0] = sims[pos[pos >= 0]]
+    # ALS scores of the candidates, normalized to [0, 1]
+    cf_scores = np.zeros(len(candidates))
+    if len(cf_ids) > 0:
+      cf_sort = np.argsort(cf_ids)
+      idx = np.clip(np.searchsorted(cf_ids[cf_sort], candidates), 0, len(cf_ids) - 1)
+      found = cf_ids[cf_sort][idx] == candidates
+      cf_scores[found] = cf_rating[cf_sort][idx[found]]
+      if cf_scores.max() > 0:
+        cf_scores = cf_scores / cf_scores.max()
+
+    # --- Fuse and rank ---
+    scores = content_weight * content_scores + cf_weight * cf_scores
+    top = np.argsort(-scores, kind='stable')[:recs_num]
+    return pd.DataFrame({'product_id': candidates[top],
+                         'content_score': content_scores[top],
+                         'cf_score': cf_scores[top],
+                         'score': scores[top]})
@@ -0,0 +1,177 @@
+"""Spell-tolerant vocabulary index of the gensim dictionary
+-------
+@note   Query tokens missing from the dictionary are dropped by doc2bow, so a query typed without diacritics
+        ("ao thun nam") or with a typo used to return nothing. The index maps them to known tokens:
+        - compound words: 2..NGRAM_MAX consecutive unsigned tokens joined with '_' ("ao thun" -> "áo_thun")
+        - accent-stripped words: unsigned form -> most frequent token ("ao" -> "áo"), dict lookup, O(1)
+          Unaccented forms are often dictionary tokens themselves ("ao", "quan", "giay" in the shipped dictionary),
+          so they are also tried as part of a compound word, and replaced by their accented form when it is
+          ACCENT_DF_RATIO times more frequent.
+        - typos: one-edit variants of the unsigned form, matched against the single-character deletions of
+          the dictionary words (sorted hash array, O(log n) per variant) and checked with the edit distance
+        Collisions are resolved by document frequency, then token id.
+@usage  index = VocabularyIndex.build(dictionary, preprocess_lib.remove_accents); index.map_tokens(tokens)
+"""
+
+"""Import libraries"""
+import numpy as np
+import metrics as mx
+
+"""Define global variables"""
+NGRAM_MAX           = 3
+TYPO_MIN_LEN        = 4
+TYPO_MAX_LEN        = 20
+ACCENT_DF_RATIO     = 5
+
+def _deletions(word):
+  """The word and its single-character deletions"""
+  return {word} | {word[:i] + word[i + 1:] for i in range(len(word))}
+
+def _within_one_edit(a, b):
+  """Check whether a and b differ by at most one insertion, deletion, substitution or transposition"""
+  if a == b:
+    return True
+  if abs(len(a) - len(b)) > 1:
+    return False
+  if len(a) > len(b):
+    a, b = b, a
+  i = 0
+  while i < len(a) and a[i] == b[i]:
+    i += 1
+  if len(a) < len(b):
+    return a[i:] == b[i + 1:]
+  if a[i + 1:] == b[i + 1:]:
+    # Substitution
+    return True
+  # Transposition of two adjacent characters
+  return i + 1 < len(a) and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]
+
+class VocabularyIndex:
+  def __init__(self, tokens, known, dfs, rank, unsigned, delete_keys, delete_ids, unsigned_tokens, strip):
+    """Use VocabularyIndex.build"""
+    self.tokens           = tokens
+    self.known            = known
+    self.dfs              = dfs
+    self.rank             = rank
+    self.unsigned         = unsigned
+    self.delete_keys      = delete_keys
+    self.delete_ids       = delete_ids
+    self.unsigned_tokens  = unsigned_tokens
+    self.strip            = strip
+
+  @classmethod
+  def build(cls, dictionary, strip):
+    """Build the index of a dictionary
+    Parameters
+    ----------
+    Arguments:
+      dictionary  {gensim.corpora.Dictionary} -- [Dictionary of the TF-IDF model]
+      strip       {callable}                  -- [Accent stripping, e.g. PreprocessLib.remove_accents]
+    Returns:
+      index {VocabularyIndex}
+    """
+    tokens = [None] * len(dictionary)
+    for token, token_id in dictionary.token2id.items():
+      tokens[token_id] = token
+    dfs = np.zeros(len(tokens), dtype=np.int64)
+    for token_id, df in dictionary.dfs.items():
+      dfs[token_id] = df
+    unsigned_tokens = [strip(token).lower() for token in tokens]
+    # Frequency order: document frequency descending, then token id
+    order = np.lexsort((np.arange(len(tokens)), -dfs))
+    rank = np.empty(len(tokens), dtype=np.int32)
+    rank[order] = np.arange(len(tokens))
+    order = order.tolist()
+    # Reversed: the most frequent token is written last and wins a collision
+    unsigned = {unsigned_tokens[token_id]: token_id for token_id in reversed(order)}
+    typo_ids = [token_id for token_id in order
+                if TYPO_MIN_LEN <= len(unsigned_tokens[token_id]) <= TYPO_MAX_LEN and '_' not in unsigned_tokens[token_id]]
+    deletions = [_deletions(unsigned_tokens[token_id]) for token_id in typo_ids]
+    ids = np.repeat(np.array(typo_ids, dtype=np.int32), [len(variants) for variants in deletions])
+    keys = np.fromiter((hash(variant) for variants in deletions for variant in variants), dtype=np.int64, count=len(ids))
+    # Stable sort keeps the frequency order among equal keys
+    sort = np.argsort(keys, kind='stable')
+    return cls(tokens, dictionary.token2id, dfs, rank, unsigned, keys[sort], ids[sort], unsigned_tokens, strip)
+
+  def correct(self, word):
+    """Find the most frequent dictionary word within one edit of an unsigned word
+    Parameters
+    ----------
+    Arguments:
+      word {str}      -- [Unsigned word]
+    Returns:
+      token_id {int}  -- [Token ID, None if there is none]
+    """
+    if not TYPO_MIN_LEN <= len(word) <= TYPO_MAX_LEN:
+      return None
+    variants = np.array([hash(v) for v in _deletions(word)], dtype=np.int64)
+    lo = np.searchsorted(self.delete_keys, variants, side='left')
+    hi = np.searchsorted(self.delete_keys, variants, side='right')
+    best = None
+    for start, end in zip(lo.tolist(), hi.tolist()):
+      # Candidates of a key are in frequency order: the first valid one is the best of the key
+      for token_id in self.delete_ids[start:end].tolist():
+        if best is not None and self.rank[token_id] >= self.rank[best]:
+          break
+        if _within_one_edit(word, self.unsigned_tokens[token_id]):
+          best = token_id
+          break
+    return best
+
+  def is_mapped(self, token):
+    """Check whether a token is kept as it is: a dictionary word with diacritics
+    Parameters
+    ----------
+    Arguments:
+      token {str}     -- [Query token after text_preprocessing]
+    Returns:
+      mapped {bool}   -- [False if the token is unknown or may have been typed without diacritics]
+    """
+    return token in self.known and not token.isascii()
+
+  def map_tokens(self, tokens, strict=False):
+    """Replace the tokens missing from the dictionary or typed without diacritics by known tokens
+    Parameters
+    ----------
+    Arguments:
+      tokens {list}   -- [Query tokens after text_preprocessing]
+    Keyword Arguments:
+      strict {bool}   -- [Return None when a token has no match, instead of dropping it (e.g. keyword filters)]
+    Returns:
+      tokens {list}   -- [Known tokens, unknown tokens without a match are dropped]
+    """
+    mapped = []
+    i = 0
+    while i < len(tokens):
+      token = tokens[i]
+      token_id = None
+      # Longest compound word first, unless all its words were typed with diacritics and are known
+      for size in range(min(NGRAM_MAX, len(tokens) - i), 1, -1):
+        if all(self.is_mapped(t) for t in tokens[i:i + size]):
+          continue
+        token_id = self.unsigned.get('_'.join(self.strip(t).lower() for t in tokens[i:i + size]))
+        if token_id is not None:
+          mx.count('vocab.compound')
+          i += size
+          break
+      if token_id is None:
+        i += 1
+        if token in self.known:
+          token_id = self.known[token]
+          # An unaccented word ("ao") stands for its accented form ("áo") when that one is much more frequent
+          accented_id = self.unsigned.get(self.strip(token).lower()) if token.isascii() else None
+          if accented_id is not None and self.dfs[accented_id] >= ACCENT_DF_RATIO * self.dfs[token_id]:
+            mx.count('vocab.accented')
+            token_id = accented_id
+        else:
+          token_id = self.unsigned.get(self.strip(token).lower())
+          if token_id is not None:
+            mx.count('vocab.unsigned')
+          else:
+            token_id = self.correct(self.strip(token).lower())
+            mx.count('vocab.unknown' if token_id is None else 'vocab.typo')
+            if token_id is None and strict:
+              return None
+      if token_id is not None:
+        mapped.append(self.tokens[token_id])
+    return mapped
@@ -0,0 +1,233 @@
+"""Voice input for the content-based search
+-------
+@note   Capture (microphone or recorded audio file) is decoupled from recognition.
+        Both run on a worker thread with timeouts, so the Streamlit script only polls the result.
+        The recognizer backend is pluggable: Google Web Speech, or an offline stand-in reading transcripts.
+"""
+
+"""Import libraries"""
+import os
+import speech_recognition as sr
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+"""Define global variables"""
+VOICE_LANGUAGE      = 'vi-VN'
+VOICE_RECOGNIZER    = os.environ.get('VOICE_RECOGNIZER', 'google')
+LISTEN_TIMEOUT      = 5.0
+PHRASE_TIME_LIMIT   = 10.0
+RECOGNIZE_TIMEOUT   = 20.0
+VOICE_WORKERS       = 2
+
+class VoiceInputError(Exception):
+  """Raised when speech cannot be captured or recognized, the message is shown to the user"""
+  pass
+
+"""Define capture sources"""
+class VoiceSample:
+  def __init__(self, audio, source=None):
+    """Captured audio
+    Parameters
+    ----------
+    Arguments:
+      audio   {sr.AudioData}  -- [Captured audio]
+    Keyword Arguments:
+      source  {str}           -- [Path of the recorded audio file, None for the microphone]
+    """
+    self.audio  = audio
+    self.source = source
+
+class MicrophoneCapture:
+  def __init__(self, timeout=LISTEN_TIMEOUT, phrase_time_limit=PHRASE_TIME_LIMIT):
+    """Capture one phrase from the default microphone
+    Parameters
+    ----------
+    Keyword Arguments:
+      timeout           {float} -- [Seconds to wait for the phrase to start]
+      phrase_time_limit {float} -- [Maximum length of the phrase in seconds]
+    """
+    self.timeout            = timeout
+    self.phrase_time_limit  = phrase_time_limit
+
+  def capture(self):
+    """Record audio
+    Returns:
+      sample {VoiceSample}  -- [Captured audio]
+    """
+    r = sr.Recognizer()
+    with sr.Microphone() as source:
+      r.adjust_for_ambient_noise(source, duration=0.5)
+      audio = r.listen(source, timeout=self.timeout, phrase_time_limit=self.phrase_time_limit)
+    return VoiceSample(audio)
+
+class AudioFileCapture:
+  def __init__(self, file_path):
+    """Capture a recorded audio file (WAV, AIFF or FLAC)
+    Parameters
+    ----------
+    Arguments:
+      file_path {str} -- [Path to the audio file]
+    """
+    self.file_path = file_path
+
+  def capture(self):
+    """Read audio
+    Returns:
+      sample {VoiceSample}  -- [Captured audio]
+    """
+    r = sr.Recognizer()
+    with sr.AudioFile(self.file_path) as source:
+      audio = r.record(source)
+    return VoiceSample(audio, self.file_path)
+
+"""Define recognizer backends"""
+class GoogleRecognizer:
+  def __init__(self, language=VOICE_LANGUAGE, timeout=RECOGNIZE_TIMEOUT):
+    """Google Web Speech API recognizer (online)
+    Parameters
+    ----------
+    Keyword Arguments:
+      language {str}    -- [Language of the speech]
+      timeout  {float}  -- [Timeout of the request in seconds]
+    """
+    self.language = language
+    self.timeout  = timeout
+
+  def recognize(self, sample):
+    """Convert speech to text
+    Parameters
+    ----------
+    Arguments:
+      sample {VoiceSample}  -- [Captured audio]
+    Returns:
+      text {str}            -- [Recognized text]
+    """
+    r = sr.Recognizer()
+    r.operation_timeout = self.timeout
+    return r.recognize_google(sample.audio, language=self.language)
+
+class OfflineRecognizer:
+  def __init__(self, transcripts=None):
+    """Offline stand-in recognizer, returns the known transcript of a recorded audio file
+    Parameters
+    ----------
+    Keyword Arguments:
+      transcripts {dict}  -- [Audio file path -> text, otherwise a sidecar "<audio file>.txt" is read]
+    """
+    self.transcripts = transcripts or {}
+
+  def recognize(self, sample):
+    """Convert speech to text
+    Parameters
+    ----------
+    Arguments:
+      sample {VoiceSample}  -- [Captured audio]
+    Returns:
+      text {str}            -- [Recognized text]
+    """
+    if sample.source is None:
+      raise sr.UnknownValueError()
+    if sample.source in self.transcripts:
+      return self.transcripts[sample.source]
+    transcript_path = os.path.splitext(sample.source)[0] + '.txt'
+    if not os.path.exists(transcript_path):
+      raise sr.UnknownValueError()
+    with open(transcript_path, 'r', encoding='utf8') as file:
+      return file.read().strip()
+
+RECOGNIZERS = {
+  'google'  : GoogleRecognizer,
+  'offline' : OfflineRecognizer,
+}
+
+def get_recognizer(name=VOICE_RECOGNIZER):
+  """Get a recognizer backend by name
+  Parameters
+  ----------
+  Keyword Arguments:
+    name {str}          -- [Name of the backend in RECOGNIZERS]
+  Returns:
+    recognizer {object} -- [Recognizer backend]
+  """
+  if name not in RECOGNIZERS:
+    raise ValueError(f'Unknown voice recognizer: {name}')
+  return RECOGNIZERS[name]()
+
+"""Define VoicePipeline class"""
+class VoicePipeline:
+  def __init__(self, recognizer=None, workers=VOICE_WORKERS):
+    """Initialize the VoicePipeline class
+    Parameters
+    ----------
+    Keyword Arguments:
+      recognizer  {object}  -- [Recognizer backend] (default: {get_recognizer()})
+      workers     {int}     -- [Maximum number of concurrent captures]
+    """
+    self.recognizer = recognizer if recognizer is not None else get_recognizer()
+    self._pool      = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='voice')
+
+  def run(self, capture):
+    """Capture then recognize, errors are converted to VoiceInputError
+    Parameters
+    ----------
+    Arguments:
+      capture {object}  -- [Capture source]
+    Returns:
+      text {str}        -- [Recognized text]
+    """
+    try:
+      sample = capture.capture()
+    except sr.WaitTimeoutError:
+      raise VoiceInputError('No speech detected, please say again ..')
+    except (OSError, AttributeError) as e:
+      # No microphone (or PyAudio) available
+      raise VoiceInputError(f'Cannot capture audio: {e}')
+    try:
+      text = self.recognizer.recognize(sample)
+    except sr.UnknownValueError:
+      raise VoiceInputError('Cannot understand the speech, please say again ..')
+    except sr.RequestError as e:
+      raise VoiceInputError(f'Speech recognition service is unavailable: {e}')
+    if not text:
+      raise VoiceInputError('Cannot understand the speech, please say again ..')
+    return text
+
+  def submit(self, capture):
+    """Start capture and recognition in the background
+    Parameters
+    ----------
+    Arguments:
+      capture {object}              -- [Capture source]
+    Returns:
+      future {concurrent.futures.Future}  -- [Future of the recognized text]
+    """
+    return self._pool.submit(self.run, capture)
+
+  def result(self, future, timeout=RECOGNIZE_TIMEOUT):
+    """Wait for the recognized text
+    Parameters
+    ----------
+    Arguments:
+      future  {Future}  -- [Future returned by submit]
+    Keyword Arguments:
+      timeout {float}   -- [Seconds to wait]
+    Returns:
+      text {str}        -- [Recognized text]
+    """
+    try:
+      return future.result(timeout=timeout)
+    except FutureTimeoutError:
+      future.cancel()
+      raise VoiceInputError('Speech recognition timed out, please say again ..')
+
+  def listen(self, capture, timeout=RECOGNIZE_TIMEOUT):
+    """Capture and recognize, waiting at most timeout seconds
+    Parameters
+    ----------
+    Arguments:
+      capture {object}  -- [Capture source]
+    Keyword Arguments:
+      timeout {float}   -- [Seconds to wait]
+    Returns:
+      text {str}        -- [Recognized text]
+    """
+    return self.result(self.submit(capture), timeout)